@@ -5,6 +5,7 @@ from app.models.profile import Profile
 from app.schemas import profile as profile_schema
 from sqlalchemy import func
 from app.models.meals import Meal
+from app.services import context_cache
 
 #jack- added these for TDEE calculations
 from app.schemas import tdee as tdee_schema
@@ -32,6 +33,7 @@ def create_or_update_profile(profile: profile_schema.ProfileCreate, db: Session
 
     db.commit()
     db.refresh(new_profile)
+    context_cache.invalidate(email)
 
     try:
         if (
@@ -85,6 +87,7 @@ def create_or_update_profile(profile: profile_schema.ProfileCreate, db: Session
 
             db.commit()
             db.refresh(new_profile)
+            context_cache.invalidate(email)
 
     except Exception as e:
         print("TDEE calculation failed:", e)
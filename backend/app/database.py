@@ -1,6 +1,10 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, exc, inspect, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -9,10 +13,156 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL environment variable is not set")
 
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+# pool settings, see .env.example
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+SLOW_CHECKOUT_MS = float(os.getenv("DB_SLOW_CHECKOUT_MS", "100"))
+POOL_WARNING_INTERVAL = 10  # seconds between pool warnings
+
+# sqlite pragmas applied to every new connection
+SQLITE_CACHE_SIZE_MB = int(os.getenv("SQLITE_CACHE_SIZE_MB", "64"))
+SQLITE_MMAP_SIZE_MB = int(os.getenv("SQLITE_MMAP_SIZE_MB", "256"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+
+class PoolMetrics:
+    """Checkout waits, saturation and timeouts for one engine's pool, plus its query count.
+
+    Checkouts and peak use come from the pool's checkout event. Waits and timeouts are
+    timed by get_db and get_async_db, which check out each request's connection up
+    front; sessions opened elsewhere (background writers) are counted but not timed.
+    """
+
+    def __init__(self, name, max_overflow=MAX_OVERFLOW):
+        self.name = name
+        self.max_overflow = max_overflow
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.timed_checkouts = 0
+        self.slow_checkouts = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.full_checkouts = 0
+        self.peak_in_use = 0
+        self.queries = 0
+        self.pool = None
+        self._last_warning = 0.0
+        self._unlogged = 0
+
+    def attach(self, pool):
+        self.pool = pool
+        event.listen(pool, "checkout", self.on_checkout)
+
+    def _capacity(self):
+        if not isinstance(self.pool, QueuePool):
+            return None
+        return self.pool.size() + max(self.max_overflow, 0)
+
+    def on_checkout(self, *args):
+        in_use = self.pool.checkedout()
+        capacity = self._capacity()
+        with self._lock:
+            self.checkouts += 1
+            self.peak_in_use = max(self.peak_in_use, in_use)
+            if capacity is None or in_use < capacity:
+                return
+            # that was the last connection, the next checkout waits
+            self.full_checkouts += 1
+        self._warn("pool full")
+
+    def record_wait(self, wait_ms, timed_out=False):
+        with self._lock:
+            self.timed_checkouts += 1
+            self.total_wait_ms += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+            if timed_out:
+                self.timeouts += 1
+            elif wait_ms > SLOW_CHECKOUT_MS:
+                self.slow_checkouts += 1
+            else:
+                return
+        self._warn(f"checkout {'timed out' if timed_out else 'slow'} after {wait_ms:.0f} ms")
+
+    def _warn(self, what):
+        # one line per interval, not one per request, while the pool is exhausted
+        with self._lock:
+            now = time.monotonic()
+            self._unlogged += 1
+            if now - self._last_warning < POOL_WARNING_INTERVAL:
+                return
+            count, self._unlogged, self._last_warning = self._unlogged, 0, now
+        print(f"DB pool {self.name}: {what} ({count} times since the last warning). {self.pool.status()}")
+
+    def count_query(self, *args):
+        with self._lock:
+            self.queries += 1
+
+    def snapshot(self):
+        with self._lock:
+            out = {
+                "queries": self.queries,
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "slow_checkouts": self.slow_checkouts,
+                "avg_wait_ms": round(self.total_wait_ms / self.timed_checkouts, 3) if self.timed_checkouts else 0.0,
+                "max_wait_ms": round(self.max_wait_ms, 3),
+                "full_checkouts": self.full_checkouts,
+                "peak_in_use": self.peak_in_use,
+            }
+        capacity = self._capacity()
+        if capacity is not None:
+            pool = self.pool
+            out.update(
+                size=pool.size(),
+                max_overflow=self.max_overflow,
+                overflow=max(pool.overflow(), 0),
+                checked_out=pool.checkedout(),
+                idle=pool.checkedin(),
+                saturation=round(pool.checkedout() / capacity, 3) if capacity else None,
+            )
+        return out
+
+
+def _pool_args(pool_class):
+    if IS_SQLITE and ":memory:" in DATABASE_URL:
+        return {}  # in-memory sqlite keeps one connection per thread, no queue pool
+    return {
+        "poolclass": pool_class,
+        "pool_size": POOL_SIZE,
+        "max_overflow": MAX_OVERFLOW,
+        "pool_timeout": POOL_TIMEOUT,
+        "pool_recycle": POOL_RECYCLE,
+        "pool_pre_ping": POOL_PRE_PING,
+    }
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers run alongside the single writer; NORMAL is safe under WAL and
+    # skips an fsync per commit
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_MB * 1024}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE_MB * 1024 * 1024}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+pool_metrics = {"sync": PoolMetrics("sync"), "async": PoolMetrics("async")}
+
 engine = create_engine(
     DATABASE_URL,
-    connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
+    connect_args={"check_same_thread": False} if IS_SQLITE else {},
+    **_pool_args(QueuePool),
 )
+pool_metrics["sync"].attach(engine.pool)
 
 SessionLocal = sessionmaker(
     autocommit=False,
@@ -20,11 +170,79 @@ SessionLocal = sessionmaker(
     bind=engine
 )
 
+# async routes use the same database through an async driver (aiosqlite / asyncpg)
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+}
+
+def _async_url(url):
+    scheme, rest = url.split("://", 1)
+    return f"{ASYNC_DRIVERS.get(scheme.split('+')[0], scheme)}://{rest}"
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _async_url(DATABASE_URL)
+
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_pool_args(AsyncAdaptedQueuePool))
+pool_metrics["async"].attach(async_engine.sync_engine.pool)
+
+event.listen(engine, "after_cursor_execute", pool_metrics["sync"].count_query)
+event.listen(async_engine.sync_engine, "after_cursor_execute", pool_metrics["async"].count_query)
+
+if IS_SQLITE:
+    event.listen(engine, "connect", _sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", _sqlite_pragmas)
+
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
 Base = declarative_base()
 
+def create_tables(bind=engine):
+    """create_all, plus the nullable columns and indexes it skips on tables that already exist."""
+    Base.metadata.create_all(bind=bind)
+    inspector = inspect(bind)
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.nullable and column.name not in existing:
+                    conn.execute(text(
+                        f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(bind.dialect)}"
+                    ))
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
+
 def get_db():
     db = SessionLocal()
     try:
+        # check the connection out now so the pool wait is measured; queries reuse it
+        start = time.perf_counter()
+        try:
+            db.connection()
+        except exc.TimeoutError:
+            pool_metrics["sync"].record_wait((time.perf_counter() - start) * 1000, timed_out=True)
+            raise
+        pool_metrics["sync"].record_wait((time.perf_counter() - start) * 1000)
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        start = time.perf_counter()
+        try:
+            await db.connection()
+        except exc.TimeoutError:
+            pool_metrics["async"].record_wait((time.perf_counter() - start) * 1000, timed_out=True)
+            raise
+        pool_metrics["async"].record_wait((time.perf_counter() - start) * 1000)
+        yield db
+
+def pool_stats():
+    return {name: m.snapshot() for name, m in pool_metrics.items()}
@@ -3,18 +3,32 @@
 All Rights Reserved.
 """
 
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 load_dotenv()
 from fastapi import FastAPI
-from app.database import engine, Base
+from app.database import engine, Base, create_tables, pool_stats
 from app.api import users, profile, preferences
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import usda, meals, recipes
+from app.routers import usda, meals, recipes, plans
 from app.routers import chat
+from app.services import recipe_catalog
+from app.services.recipe_images import print_image_report
+from app.services.meal_log_queue import meal_log_queue
 
-Base.metadata.create_all(bind=engine)
+create_tables()
+
+# parse the recipe csvs once at startup instead of on the first /recipes request
+recipe_catalog.get_catalog()
+print_image_report(recipe_catalog.image_report())
 
-app = FastAPI(title="ChompSmart DB")
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    # write chat auto-logs still in the queue before the process exits
+    await meal_log_queue.stop()
+
+app = FastAPI(title="ChompSmart DB", lifespan=lifespan)
 
 app.include_router(users.router)
 app.include_router(chat.router)
@@ -23,11 +37,17 @@ app.include_router(preferences.router)
 app.include_router(usda.router)
 app.include_router(meals.router)
 app.include_router(recipes.router)
+app.include_router(plans.router)
 
 @app.get("/")
 def root():
     return {"status": "Backend running"}
 
+@app.get("/metrics/db")
+def db_metrics():
+    # pool checkout waits and saturation for the sync and async engines
+    return pool_stats()
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:5173"],
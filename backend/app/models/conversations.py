@@ -0,0 +1,27 @@
+from sqlalchemy import Column, Integer, String, Text, Index
+from sqlalchemy.sql import func
+from app.database import Base
+from app.models.meals import CreatedAt
+
+class Conversation(Base):
+    """A chat thread kept server-side so clients send only the new message each turn."""
+    __tablename__ = "conversations"
+
+    id = Column(String, primary_key=True)
+    user_email = Column(String, nullable=True, index=True)
+
+    # rolling summary of messages[:summary_through], regenerated when it goes stale
+    summary = Column(Text, nullable=True)
+    summary_through = Column(Integer, nullable=False, default=0)
+
+    created_at = Column(CreatedAt, server_default=func.now())
+
+class ChatMessage(Base):
+    __tablename__ = "chat_messages"
+    __table_args__ = (Index("ix_chat_messages_conversation_id_id", "conversation_id", "id"),)
+
+    id = Column(Integer, primary_key=True)
+    conversation_id = Column(String, nullable=False)
+    role = Column(String, nullable=False)  # "user" or "model"
+    body = Column(Text, nullable=False)
+    created_at = Column(CreatedAt, server_default=func.now())
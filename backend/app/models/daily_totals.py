@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, String, Float, Date, UniqueConstraint
+from app.database import Base
+
+class DailyTotal(Base):
+    """Running nutrient sums for one user's local calendar day, kept in step with meals."""
+    __tablename__ = "daily_totals"
+    __table_args__ = (UniqueConstraint("user_email", "day", name="uq_daily_totals_user_day"),)
+
+    id = Column(Integer, primary_key=True)
+    user_email = Column(String, nullable=False)
+    day = Column(Date, nullable=False)
+
+    calories = Column(Float, nullable=False, default=0)
+    protein = Column(Float, nullable=False, default=0)
+    carbs = Column(Float, nullable=False, default=0)
+    fats = Column(Float, nullable=False, default=0)
+    fiber = Column(Float, nullable=False, default=0)
+    sodium = Column(Float, nullable=False, default=0)
+    meal_count = Column(Integer, nullable=False, default=0)
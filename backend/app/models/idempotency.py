@@ -0,0 +1,16 @@
+from sqlalchemy import Column, Integer, String, Text, UniqueConstraint
+from sqlalchemy.sql import func
+from app.database import Base
+from app.models.meals import CreatedAt
+
+class IdempotencyKey(Base):
+    """Response stored for a client-supplied Idempotency-Key, replayed on retries."""
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (UniqueConstraint("user_email", "key", name="uq_idempotency_user_key"),)
+
+    id = Column(Integer, primary_key=True)
+    user_email = Column(String, nullable=False)
+    key = Column(String, nullable=False)
+    request_hash = Column(String, nullable=False)
+    response = Column(Text, nullable=False)
+    created_at = Column(CreatedAt, server_default=func.now(), index=True)
@@ -1,12 +1,23 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Index
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.sql import func
 from app.database import Base
 
+# sqlite stores timestamps as text. CURRENT_TIMESTAMP writes "YYYY-MM-DD HH:MM:SS", so
+# bound parameters use the same format or range/cursor comparisons on created_at break
+# at the boundary second.
+CreatedAt = DateTime(timezone=True).with_variant(
+    sqlite.DATETIME(storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"),
+    "sqlite",
+)
+
 class Meal(Base):
     __tablename__ = "meals"
+    # day lookups are range scans on (user_email, created_at), see services/meal_days.py
+    __table_args__ = (Index("ix_meals_user_email_created_at", "user_email", "created_at"),)
 
     id = Column(Integer, primary_key=True, index=True)
-    user_email = Column(String, index=True)
+    user_email = Column(String)
     meal_type = Column(String)
     food_name = Column(String)
     
@@ -17,4 +28,8 @@ class Meal(Base):
     fiber = Column(Float)
     sodium = Column(Float)
     
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    created_at = Column(CreatedAt, server_default=func.now())
+
+    # the user's local day this meal was added to in daily_totals, so deleting it takes
+    # it off that same day; null for meals logged before the column existed
+    logged_day = Column(Date, nullable=True)
\ No newline at end of file
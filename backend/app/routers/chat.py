@@ -1,32 +1,39 @@
 import base64
 import io
-from PIL import Image
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import UploadFile
 from requests import request
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import func
 from pydantic import BaseModel
-import os
-import google.generativeai as genai
 from dotenv import load_dotenv
 import json
 import re
 import time
-from app.database import get_db
+from app.database import AsyncSessionLocal, get_async_db
 from app.models.profile import Profile
-from app.models.meals import Meal
-from datetime import date
+from app.services import chat_memory, daily_totals
+from app.services.context_cache import context_cache
+from app.services.llm_backends import get_backend
+from app.services.llm_client import LLMError, llm_client
+from app.services.response_cache import image_hash, make_key, response_cache
+from app.services.meal_days import local_today, meals_on_day, resolve_timezone
+from app.services.meal_log_queue import meal_log_queue
+from app.services.photo_upload import MAX_UPLOAD_BYTES, UploadTooLarge, limit_receive, prepare_image
 
 load_dotenv()
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
+# gemini unless LLM_BACKEND=stub (offline, for benchmarks and load tests)
+llm_backend = get_backend()
 
 # helper function to get user profile
-def get_user_context(db: Session, user_email: str) -> str:
+# these take a sync Session; the async routes call them through AsyncSession.run_sync,
+# which runs them on the async driver without blocking the event loop
+def get_user_context(db: Session, user_email: str, tz: str | None = None) -> str:
     if not user_email: return ""
 
     user = db.query(Profile).filter(Profile.user_email == user_email).first()
@@ -54,15 +61,11 @@ def get_user_context(db: Session, user_email: str) -> str:
     """
 
     user_goal = user.calorie_goal if user.calorie_goal else 2000
-    today = date.today()
-    todays_meals = db.query(Meal).filter(
-        Meal.user_email == user_email,
-        func.date(Meal.created_at) == today
-    ).all()
+    todays_meals = meals_on_day(db, user_email, tz)
 
     log_text = "[DAILY LOG: No meals logged today]"
     if todays_meals:
-        total_cals = sum(m.calories for m in todays_meals if m.calories)
+        total_cals = daily_totals.get_totals(db, user_email, local_today(resolve_timezone(tz)))["calories"]
         meal_list = ", ".join([f"{m.food_name}" for m in todays_meals])
         log_text = f"""
         [DAILY LOG]
@@ -105,102 +108,331 @@ You are Chompy. The user sent a food photo.
 6. End your response by asking the user if they want to log this meal and which meal slot (Breakfast, Lunch, Dinner) it belongs to.
 """
 
-model = genai.GenerativeModel(
-    model_name="gemini-2.5-flash", 
-    system_instruction=CHAT_PROMPT 
-)
+SUMMARY_PROMPT = """
+You summarize a conversation between a user and Chompy, a nutrition assistant.
+Keep facts that matter for later turns: foods discussed or logged, goals, preferences,
+allergies, questions still open. Plain sentences, no more than 120 words.
+"""
+
+CHAT_MODEL_NAME = "gemini-2.5-flash"
+
+model = llm_backend.model(CHAT_MODEL_NAME, CHAT_PROMPT)
+
+summary_model = llm_backend.model(CHAT_MODEL_NAME, SUMMARY_PROMPT)
 
 # MODELS
 class ChatRequest(BaseModel):
     message: str
-    history: list = []
+    history: list = []  # only used when there is no conversation_id (older clients)
     user_email: str | None = None
+    timezone: str | None = None
+    conversation_id: str | None = None
 
 class ImageChatRequest(BaseModel):
     image: str
     user_email: str | None = None
+    timezone: str | None = None
+
+LOG_MEAL_MARKER = "LOG_MEAL:"
+
+async def load_user_context(db: AsyncSession, user_email: str | None, tz: str | None) -> str:
+    """get_user_context, served from the per-user cache when nothing has changed."""
+    if not user_email:
+        return ""
+    cached = context_cache.get(user_email, tz)
+    if cached is not None:
+        return cached
+    version = context_cache.version(user_email)
+    text = await db.run_sync(get_user_context, user_email, tz)
+    context_cache.put(user_email, tz, text, version)
+    return text
+
+def reply_cache_key(prompt: str, image: str | None = None) -> str:
+    # backend name keeps stub replies out of a persistent cache shared with gemini
+    return make_key(f"{llm_backend.name}/{CHAT_MODEL_NAME}", CHAT_PROMPT, prompt, image)
+
+async def remember_reply(endpoint: str, key: str, text: str):
+    # a reply that logs a meal must reach finish_reply every time, never a cache hit
+    if LOG_MEAL_MARKER in text:
+        response_cache.skip(endpoint)
+    else:
+        await response_cache.put(endpoint, key, text)
+
+NAP_REPLY = "Chompy is taking a nap. Try again!"
+PHOTO_ERROR_REPLY = "Oh snap! I couldn't quite make out that picture."
+LLM_ERROR_REPLIES = {
+    "busy": "Chompy is helping a lot of gators right now. Try again in a moment!",
+    "timeout": "Chompy took too long to think that one over. Try again!",
+    "unavailable": "Chompy is taking a nap. Try again in a minute!",
+}
+
+def error_reply(e: Exception, fallback: str = NAP_REPLY) -> dict:
+    """Friendly reply for a failed model call, plus a code the client can act on."""
+    if isinstance(e, LLMError):
+        return {"reply": LLM_ERROR_REPLIES.get(e.code, fallback), "error": e.code}
+    return {"reply": fallback, "error": "error"}
+
+def build_chat_prompt(user_context: str, history_str: str, message: str) -> str:
+    return f"{user_context}\n{history_str}\nUser: {message}\nModel:"
+
+async def summarize_conversation(previous: str | None, transcript: str) -> str:
+    prompt = f"Previous summary:\n{previous or '(none)'}\n\nNew messages:{transcript}\n\nUpdated summary:"
+    reply = await llm_client.generate(summary_model, prompt)
+    return reply.strip()
+
+async def load_history(db: AsyncSession, request: ChatRequest) -> tuple[str | None, str]:
+    """(conversation id, history text). Older clients that send history get a budgeted tail of it."""
+    if request.conversation_id is None and request.history:
+        history_str = ""
+        for msg in chat_memory.trim_client_history(request.history):
+            role = "User" if msg.get('from') == "me" else "Model"
+            content = msg.get('body', '[Image Sent]')
+            history_str += f"\n{role}: {content}"
+        return None, history_str
+    try:
+        return await chat_memory.build_history(db, request.conversation_id, request.user_email, summarize_conversation)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+def finish_reply(request: ChatRequest, reply_text: str) -> tuple[str, str | None]:
+    """Strip a trailing LOG_MEAL block from the model's reply and queue the meal it describes.
+
+    Returns (reply, pending log id). The meal is written in the background; the client
+    can follow it at GET /chat/log/{id}.
+    """
+    if LOG_MEAL_MARKER not in reply_text:
+        return reply_text, None
+
+    parts = reply_text.split(LOG_MEAL_MARKER, 1)
+    conversation_part = parts[0].strip()
+    json_part = parts[1].strip()
+
+    try:
+        json_part = json_part.replace("```json", "").replace("```", "").strip()
+        meal_data = json.loads(json_part)
+        if not isinstance(meal_data, dict):
+            raise ValueError("LOG_MEAL block is not an object")
+
+        pending_id = None
+        if request.user_email:
+            pending_id = meal_log_queue.submit(request.user_email, meal_data, request.timezone)
+        return conversation_part, pending_id
+
+    except Exception as e:
+        print(f"Auto-Log Error: {e}")
+        return conversation_part + " (I tried to log that, but hit a glitch!)", None
+
+async def save_turn(conversation_id: str, message: str, reply: str):
+    # runs after the response is sent, so it can't share the request's session
+    async with AsyncSessionLocal() as db:
+        await db.run_sync(chat_memory.append, conversation_id, message, reply)
+
+def _held_back(text: str) -> int:
+    """Length of text that can be sent without risking a partial LOG_MEAL marker at the end."""
+    cut = text.find(LOG_MEAL_MARKER)
+    if cut >= 0:
+        return cut
+    for k in range(len(LOG_MEAL_MARKER) - 1, 0, -1):
+        if text.endswith(LOG_MEAL_MARKER[:k]):
+            return len(text) - k
+    return len(text)
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 # ROUTES
 @router.post("/message")
-async def chat_response(request: ChatRequest, db: Session = Depends(get_db)):
-    if not GEMINI_API_KEY:
+async def chat_response(request: ChatRequest, background: BackgroundTasks, db: AsyncSession = Depends(get_async_db)):
+    if not llm_backend.configured:
+        raise HTTPException(status_code=500, detail="Gemini API key not configured.")
+
+    user_context = await load_user_context(db, request.user_email, request.timezone)
+    conversation_id, history_str = await load_history(db, request)
+    # hand the connection back to the pool instead of holding it while the model thinks
+    await db.close()
+    full_prompt = build_chat_prompt(user_context, history_str, request.message)
+    key = reply_cache_key(full_prompt)
+    
+    try:
+        reply_text = await response_cache.get("message", key)
+        if reply_text is None:
+            reply_text = await llm_client.generate(model, full_prompt, key=key)
+            await remember_reply("message", key, reply_text)
+        reply, pending_log_id = finish_reply(request, reply_text)
+        if conversation_id:
+            background.add_task(save_turn, conversation_id, request.message, reply)
+        return {"reply": reply, "conversation_id": conversation_id, "pending_log_id": pending_log_id}
+
+    except Exception as e:
+        print(f"Gemini Error: {e!r}")
+        return {**error_reply(e), "conversation_id": conversation_id}
+
+
+@router.post("/message/stream")
+async def chat_response_stream(request: ChatRequest, db: AsyncSession = Depends(get_async_db)):
+    """Same as /message, relayed as server-sent events while Gemini generates.
+
+    event: token  {"text": ...}   reply text as it arrives, LOG_MEAL block held back
+    event: done   {"reply": ..., "conversation_id": ..., "pending_log_id": ..., "ttfb_ms": ..., "total_ms": ...}
+    event: error  {"reply": ..., "error": "busy" | "timeout" | "unavailable" | "error"}
+    """
+    if not llm_backend.configured:
         raise HTTPException(status_code=500, detail="Gemini API key not configured.")
 
-    user_context = get_user_context(db, request.user_email)
+    start = time.perf_counter()
+    user_context = await load_user_context(db, request.user_email, request.timezone)
+    conversation_id, history_str = await load_history(db, request)
+    # hand the connection back to the pool instead of holding it while the model thinks
+    await db.close()
+    full_prompt = build_chat_prompt(user_context, history_str, request.message)
+    key = reply_cache_key(full_prompt)
+    cached = await response_cache.get("message/stream", key)
+
+    async def chunks():
+        if cached is not None:
+            yield cached
+            return
+        async for piece in llm_client.stream(model, full_prompt, key=key):
+            yield piece
+
+    async def events():
+        text = ""
+        sent = 0
+        ttfb_ms = None
+        try:
+            async for piece in chunks():
+                text += piece
+                safe = _held_back(text)
+                if safe > sent:
+                    if ttfb_ms is None:
+                        ttfb_ms = (time.perf_counter() - start) * 1000
+                    yield _sse("token", {"text": text[sent:safe]})
+                    sent = safe
+        except Exception as e:
+            print(f"Gemini Error: {e!r}")
+            yield _sse("error", error_reply(e))
+            return
+        if cached is None:
+            await remember_reply("message/stream", key, text)
+
+        reply, pending_log_id = finish_reply(request, text)
+        if conversation_id:
+            # runs once the stream ends, even if the client hangs up right after "done"
+            background.add_task(save_turn, conversation_id, request.message, reply)
+        if LOG_MEAL_MARKER not in text and len(text) > sent:
+            yield _sse("token", {"text": text[sent:]})
+        total_ms = (time.perf_counter() - start) * 1000
+        print(f"Chat stream: first token {ttfb_ms or total_ms:.0f} ms, total {total_ms:.0f} ms")
+        yield _sse("done", {
+            "reply": reply,
+            "conversation_id": conversation_id,
+            "pending_log_id": pending_log_id,
+            "ttfb_ms": round(ttfb_ms if ttfb_ms is not None else total_ms, 1),
+            "total_ms": round(total_ms, 1),
+        })
+
+    background = BackgroundTasks()
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=background,
+    )
+
+
+@router.get("/metrics")
+def chat_metrics():
+    return {
+        "context_cache": context_cache.stats(),
+        "response_cache": response_cache.stats(),
+        "llm": llm_client.stats(),
+        "meal_log": meal_log_queue.stats(),
+    }
+
+
+@router.get("/log/{pending_id}")
+async def chat_log_status(pending_id: str):
+    """Where an auto-logged meal is: pending, logged (with meal_id) or failed."""
+    status = meal_log_queue.status(pending_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Pending log not found")
+    return {"id": pending_id, **status}
+
+
+async def describe_photo(db: AsyncSession, user_email: str | None, tz: str | None, jpeg: bytes) -> str:
+    user_context = await load_user_context(db, user_email, tz)
+    await db.close()
+    final_prompt = f"{VISION_PROMPT}\n\nCONTEXT:\n{user_context}"
+    key = reply_cache_key(final_prompt, image_hash(jpeg))
+    reply = await response_cache.get("upload", key)
+    if reply is None:
+        reply = await llm_client.generate(model, [final_prompt, {"mime_type": "image/jpeg", "data": jpeg}], key=key)
+        await remember_reply("upload", key, reply)
+    return reply
+
+
+@router.post("/upload/photo")
+async def analyze_photo(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """multipart/form-data with a `photo` file plus optional user_email and timezone fields."""
+    if not llm_backend.configured:
+        raise HTTPException(status_code=500, detail="Gemini API key not configured.")
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="Photo is too large.")
 
-    history_str = ""
-    if request.history:
-        for msg in request.history:
-            role = "User" if msg.get('from') == "me" else "Model"
-            content = msg.get('body', '[Image Sent]')
-            history_str += f"\n{role}: {content}"
+    # count bytes as they arrive so a missing or lying content-length can't get past the cap
+    limited = Request(request.scope, limit_receive(request.receive))
+    try:
+        form = await limited.form(max_files=1, max_fields=4)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
 
-    full_prompt = f"{user_context}\n{history_str}\nUser: {request.message}\nModel:"
-    
     try:
-        response = model.generate_content(full_prompt)
-        reply_text = response.text
-
-        # handle meal logging
-        if "LOG_MEAL:" in reply_text:
-            parts = reply_text.split("LOG_MEAL:", 1)
-            conversation_part = parts[0].strip()
-            json_part = parts[1].strip()
-
-            try:
-                json_part = json_part.replace("```json", "").replace("```", "").strip()
-                meal_data = json.loads(json_part)
-
-                if request.user_email:
-                    new_meal = Meal(
-                        user_email=request.user_email,
-                        food_name=meal_data.get("name", "Unknown Food"),
-                        calories=meal_data.get("calories", 0),
-                        protein=meal_data.get("protein", 0),
-                        carbs=meal_data.get("carbs", 0),
-                        fats=meal_data.get("fats", 0),
-                        sodium=meal_data.get("sodium", 0),
-                        fiber=meal_data.get("fiber", 0),
-                        meal_type=meal_data.get("meal_type", "Snack"),
-                    )
-                    db.add(new_meal)
-                    db.commit()
-                    print(f"AUTO-LOGGED: {new_meal.food_name}")
-
-                return {"reply": conversation_part}
-
-            except Exception as e:
-                print(f"Auto-Log Error: {e}")
-                return {"reply": conversation_part + " (I tried to log that, but hit a glitch!)"}
-        
-        return {"reply": reply_text}
+        photo = form.get("photo")
+        if not isinstance(photo, UploadFile):
+            raise HTTPException(status_code=400, detail="Missing photo file.")
+        try:
+            jpeg = await run_in_threadpool(prepare_image, photo.file)
+        except UploadTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        await form.close()
 
+    try:
+        reply = await describe_photo(db, form.get("user_email") or None, form.get("timezone") or None, jpeg)
+        return {"reply": reply}
     except Exception as e:
-        print(f"Gemini Error: {e}")
-        return {"reply": "Chompy is taking a nap. Try again!"}
+        print(f"Vision Error: {e!r}")
+        return error_reply(e, PHOTO_ERROR_REPLY)
 
 
 @router.post("/upload")
-async def analyze_image(request: ImageChatRequest, db: Session = Depends(get_db)):
-    if not GEMINI_API_KEY:
+async def analyze_image(request: ImageChatRequest, db: AsyncSession = Depends(get_async_db)):
+    """Base64 photo in a JSON body, kept for older clients; prefer /upload/photo."""
+    if not llm_backend.configured:
         raise HTTPException(status_code=500, detail="Gemini API key not configured.")
-    
-    user_context = get_user_context(db, request.user_email)
 
+    if "," in request.image:
+        header, encoded = request.image.split(",", 1)
+    else:
+        encoded = request.image
+    if len(encoded) * 3 // 4 > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="Photo is too large.")
+
+    # same status codes as /upload/photo for a photo that can't be used
     try:
-        if "," in request.image:
-            header, encoded = request.image.split(",", 1)
-        else:
-            encoded = request.image
-        
         bytes_data = base64.b64decode(encoded)
-        img = Image.open(io.BytesIO(bytes_data))
+        jpeg = await run_in_threadpool(prepare_image, io.BytesIO(bytes_data))
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        final_prompt = f"{VISION_PROMPT}\n\nCONTEXT:\n{user_context}"
-        
-        response = model.generate_content([final_prompt, img])
-        return {"reply": response.text}
-    
+    try:
+        reply = await describe_photo(db, request.user_email, request.timezone, jpeg)
+        return {"reply": reply}
     except Exception as e:
-        print(f"Vision Error: {e}")
-        return {"reply": "Oh snap! I couldn't quite make out that picture."}
\ No newline at end of file
+        print(f"Vision Error: {e!r}")
+        return error_reply(e, PHOTO_ERROR_REPLY)
@@ -1,9 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import date, timedelta
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from datetime import date
-from app.database import get_db
+from app.database import SessionLocal, get_db
 from app.models.meals import Meal
+from app.models.profile import Profile
+from app.schemas.meals import MealBatch, MealItem
+from app.services import context_cache, daily_totals, idempotency, meal_history, meal_trends
+from app.services.meal_days import local_date, local_today, meals_on_day, resolve_timezone
 
 router = APIRouter(prefix="/meals", tags=["meals"])
 
@@ -24,35 +31,168 @@ def log_meal(meal: dict, db: Session = Depends(get_db)):
 
     m = Meal(**meal_data)
     db.add(m)
+    daily_totals.add_meal(db, m, local_today(resolve_timezone(meal.get("timezone"))))
     db.commit()
+    context_cache.invalidate(m.user_email)
     db.refresh(m) 
     return {"ok": True, "id": m.id} 
 
-@router.get("/log")
-def get_meals(db: Session = Depends(get_db)):
-    return db.query(Meal).all()
+@router.get("/history")
+def get_meal_history(
+    user_email: str,
+    start: date | None = Query(None, description="first local date, YYYY-MM-DD"),
+    end: date | None = Query(None, description="last local date (inclusive), YYYY-MM-DD"),
+    tz: str | None = None,
+    cursor: str | None = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(50, ge=1, le=200),
+    db: Session = Depends(get_db),
+):
+    stmt = meal_history.history_query(user_email, start, end, tz)
+    try:
+        meals, next_cursor = meal_history.history_page(db, stmt, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"meals": meals, "next_cursor": next_cursor}
+
+@router.get("/export")
+def export_meals(
+    user_email: str,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    start: date | None = None,
+    end: date | None = None,
+    tz: str | None = None,
+):
+    stmt = meal_history.history_query(user_email, start, end, tz)
+    if format == "csv":
+        body, media_type = meal_history.export_csv(SessionLocal, stmt), "text/csv"
+    else:
+        body, media_type = meal_history.export_ndjson(SessionLocal, stmt), "application/x-ndjson"
+    filename = f"meals.{'csv' if format == 'csv' else 'ndjson'}"
+    return StreamingResponse(body, media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+def _replay(stored, req_hash, response):
+    try:
+        body = idempotency.replay(stored, req_hash)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    response.headers["Idempotent-Replayed"] = "true"
+    return body
+
+@router.post("/log/batch")
+def log_meal_batch(
+    batch: MealBatch,
+    response: Response,
+    idempotency_key: str | None = Header(None, max_length=255),
+    db: Session = Depends(get_db),
+):
+    # a retried request with the same key gets the first response back instead of logging again
+    req_hash = idempotency.request_hash(batch.model_dump())
+    if idempotency_key:
+        stored = idempotency.lookup(db, batch.user_email, idempotency_key)
+        if stored is not None:
+            return _replay(stored, req_hash, response)
+
+    valid, errors = [], []
+    for i, raw in enumerate(batch.items):
+        try:
+            valid.append(MealItem.model_validate(raw))
+        except ValidationError as e:
+            errors.append({"index": i, "errors": e.errors(include_url=False, include_input=False)})
+
+    ids = []
+    if valid:
+        day = local_today(resolve_timezone(batch.timezone))
+        rows = [{"user_email": batch.user_email, "logged_day": day, **item.model_dump()} for item in valid]
+        # one executemany insert for the whole plate
+        ids = list(db.scalars(insert(Meal).returning(Meal.id, sort_by_parameter_order=True), rows))
+        amounts = {k: sum(getattr(item, k) for item in valid) for k in daily_totals.NUTRIENTS}
+        daily_totals.add_amounts(db, batch.user_email, day, amounts, len(valid))
+
+    result = {"ok": not errors, "ids": ids, "inserted": len(ids), "errors": errors}
+    if idempotency_key:
+        try:
+            with db.begin_nested():
+                idempotency.save(db, batch.user_email, idempotency_key, req_hash, result)
+        except IntegrityError:
+            # a concurrent request with the same key committed first, keep its meals only
+            db.rollback()
+            return _replay(idempotency.lookup(db, batch.user_email, idempotency_key), req_hash, response)
+    db.commit()
+    if ids:
+        context_cache.invalidate(batch.user_email)
+    return result
 
 @router.get("/today")
-def get_today_meals(user_email: str, db: Session = Depends(get_db)):
-    today = date.today()
-    meals = db.query(Meal).filter(
-        Meal.user_email == user_email,
-        func.date(Meal.created_at) == today
-    ).all()
-    return meals
+def get_today_meals(user_email: str, tz: str | None = None, db: Session = Depends(get_db)):
+    # tz is the browser's IANA timezone so "today" starts at the user's midnight
+    return meals_on_day(db, user_email, tz)
+
+@router.get("/summary")
+def get_daily_summary(
+    user_email: str,
+    day: date | None = Query(None, alias="date", description="YYYY-MM-DD, default today in tz"),
+    tz: str | None = None,
+    db: Session = Depends(get_db),
+):
+    day = day or local_today(resolve_timezone(tz))
+    totals = daily_totals.get_totals(db, user_email, day)
+    profile = db.query(Profile).filter(Profile.user_email == user_email).first()
+    goals, remaining = daily_totals.summarize(totals, profile)
+    return {"user_email": user_email, "date": day.isoformat(), "totals": totals, "goals": goals, "remaining": remaining}
+
+@router.get("/trends")
+def get_trends(
+    user_email: str,
+    start: date | None = Query(None, description="first local date, default `days` before end"),
+    end: date | None = Query(None, description="last local date, default today in tz"),
+    days: int = Query(90, ge=1, le=3660),
+    bucket: str = Query("auto", pattern="^(auto|day|week|month)$"),
+    points: int = Query(meal_trends.DEFAULT_POINTS, ge=2, le=500, description="max points in the series"),
+    tz: str | None = None,
+    db: Session = Depends(get_db),
+):
+    end = end or local_today(resolve_timezone(tz))
+    start = start or end - timedelta(days=days - 1)
+    if start > end:
+        raise HTTPException(status_code=400, detail="start is after end")
+    if bucket == "auto":
+        bucket = meal_trends.pick_bucket(start, end, points)
+
+    series = meal_trends.bucket_series(db, user_email, start, end, bucket)
+    profile = db.query(Profile).filter(Profile.user_email == user_email).first()
+    return {
+        "user_email": user_email,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "bucket": bucket,
+        "calorie_goal": profile.calorie_goal if profile else None,
+        "series": meal_trends.downsample(series, points),
+        "rolling": meal_trends.rolling_averages(db, user_email, end),
+    }
 
 @router.delete("/reset")
 def reset_daily_log(user_email: str, db: Session = Depends(get_db)):
     db.query(Meal).filter(Meal.user_email == user_email).delete()
+    daily_totals.clear_user(db, user_email)
     db.commit()
+    context_cache.invalidate(user_email)
     return {"ok": True}
 
 @router.delete("/{meal_id}")
-def delete_meal(meal_id: int, db: Session = Depends(get_db)):
+def delete_meal(meal_id: int, tz: str | None = None, db: Session = Depends(get_db)):
     meal = db.query(Meal).filter(Meal.id == meal_id).first()
     if not meal:
         raise HTTPException(status_code=404, detail="Meal not found")
     
+    # tz only matters for meals logged before logged_day was stored
+    day = meal.logged_day
+    if day is None and meal.created_at is not None:
+        day = local_date(meal.created_at, resolve_timezone(tz))
+    if day is not None:
+        daily_totals.add_meal(db, meal, day, sign=-1)
+    user_email = meal.user_email
     db.delete(meal)
     db.commit()
-    return {"ok": True}
\ No newline at end of file
+    context_cache.invalidate(user_email)
+    return {"ok": True}
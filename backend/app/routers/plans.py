@@ -0,0 +1,59 @@
+import time
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from app.database import get_db
+from app.models.profile import Profile
+from app.services import meal_plan, recipe_catalog, recipe_recommend
+from app.services.diet_flags import mask_from_restrictions
+
+router = APIRouter(prefix="/plans", tags=["plans"])
+
+PLAN_RECIPE_FIELDS = ("slug", "title", "category", "image_url", "calories", "protein_g", "carbs_g", "fat_g")
+
+
+@router.get("/week")
+def get_week_plan(
+    user_email: str = Query(...),
+    tolerance: float = Query(meal_plan.DEFAULT_TOLERANCE, gt=0, le=1),
+    max_repeats: int = Query(meal_plan.DEFAULT_MAX_REPEATS, ge=1, le=7),
+    seed: int | None = Query(None),
+    db: Session = Depends(get_db),
+):
+    profile = db.query(Profile).filter(Profile.user_email == user_email).first()
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+
+    restrictions = profile.dietary_restrictions if isinstance(profile.dietary_restrictions, list) else []
+    goals = recipe_recommend.macro_goals(profile)
+    catalog = recipe_catalog.get_catalog()
+
+    start = time.perf_counter()
+    plan = meal_plan.plan_week(
+        catalog,
+        goals,
+        mask_from_restrictions(restrictions),
+        tolerance=tolerance,
+        max_repeats=max_repeats,
+        seed=meal_plan.user_seed(user_email) if seed is None else seed,
+    )
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    days = []
+    for d in plan["days"]:
+        d = dict(d)
+        meals = {}
+        for slot, (row, servings) in d["meals"].items():
+            meals[slot] = catalog.recipes[row].to_dict(PLAN_RECIPE_FIELDS)
+            meals[slot]["servings"] = servings
+        d["meals"] = meals
+        days.append(d)
+    return {
+        "user_email": user_email,
+        "goals": dict(zip(recipe_recommend.MACRO_KEYS, [round(v, 1) for v in goals.tolist()])),
+        "tolerance": tolerance,
+        "days": days,
+        "timed_out": plan["timed_out"],
+        "elapsed_ms": round(elapsed_ms, 1),
+    }
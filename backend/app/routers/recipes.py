@@ -1,278 +1,283 @@
-import csv
-import re
-from pathlib import Path
+import hashlib
+import time
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
 
 from app.database import get_db
 from app.models.profile import Profile
+from app.services import image_derivatives, recipe_catalog, recipe_recommend
+from app.services.diet_flags import PROFILE_TO_BIT, mask_from_restrictions
+from app.services.http_cache import (
+    IMMUTABLE_CACHE_CONTROL,
+    REVALIDATE_CACHE_CONTROL,
+    cache_headers,
+    is_not_modified,
+    not_modified_response,
+)
+from app.services.meal_days import meals_on_day
+from app.services.recipe_catalog import IMAGES_DIR, RECIPE_FIELDS, image_index
 
 router = APIRouter(prefix="/recipes", tags=["recipes"])
 
-BASE_DIR = Path(__file__).resolve().parent.parent.parent.parent
-RECIPES_DIR = BASE_DIR / "data" / "recipes"
-CSV_DIR = RECIPES_DIR / "csv"
-IMAGES_DIR = RECIPES_DIR / "images"
-
-PROFILE_TO_CSV_COLUMN = {
-    "Dairy-free": "Dairy-Free",
-    "Egg-free": "Egg-Free",
-    "Gluten-free": "Gluten-Free",
-    "Keto": "Keto",
-    "Low-carb": "Low-Carb",
-    "Low-fat": "Low-Fat",
-    "Low-salt": "Low-Salt",
-    "Low-sugar": "Low-Sugar",
-    "No seafood": "No Seafood",
-    "Paleo": "Paleo",
-    "Soy-free": "Soy-Free",
-    "Vegan": "Vegan",
-    "Vegetarian": "Vegetarian",
-}
-
-CSV_COLUMN_TO_PROFILE = {}
-for profile_label, csv_col in PROFILE_TO_CSV_COLUMN.items():
-    CSV_COLUMN_TO_PROFILE[csv_col] = profile_label
-
-MEAL_CSV_FILES = [
-    ("Breakfast", "Breakfast.Recipe.Database.2.13.csv"),
-    ("Lunch", "Lunch.Recipe.Database.2.13.csv"),
-    ("Dinner", "Dinner.Recipe.Database.2.13.csv"),
-    ("Dessert", "Dessert.Recipe.Database.2.13.csv"),
-]
-DIET_FLAGS_FILE = "Recipe.Database.Diet.Flags.2.13.csv"
-
-
-def _normalize_header(key):
-    k = (key or "").strip()
-    if "Recipe Title" in k:
-        return "Recipe Title"
-    if "Serving Size" in k:
-        return "Serving Size"
-    if "Total Preparation" in k or "Preparation Time" in k:
-        return "Total Preparation Time (min)"
-    if k == "Ingredients":
-        return "Ingredients"
-    if k == "Steps":
-        return "Steps"
-    if "Total Calories" in k or "Calories" in k:
-        return "calories"
-    if "Protein" in k and "Per Serving" in k:
-        return "protein_g"
-    if "Carbohydrates" in k:
-        return "carbs_g"
-    if "Fat (g)" in k or ("Fat" in k and "Per" in k):
-        return "fat_g"
-    if "Fiber" in k:
-        return "fiber_g"
-    if "Sodium" in k:
-        return "sodium_mg"
-    return k
-
-
-def _slug(title):
-    if not title:
-        return ""
-    lower = title.lower()
-    letters_and_digits = re.sub(r"[^a-z0-9]+", "", lower)
-    return letters_and_digits
-
-
-def _find_image(slug):
-    if not slug:
+
+def _get_user_restrictions(db, user_email):
+    if not user_email:
         return None
-    extensions = [".jpg", ".jpeg", ".png", ".webp"]
-    for ext in extensions:
-        file_path = IMAGES_DIR / (slug + ext)
-        if file_path.is_file():
-            return file_path.name
-    if not IMAGES_DIR.is_dir():
+    profile = db.query(Profile).filter(Profile.user_email == user_email).first()
+    return _profile_restrictions(profile)
+
+
+def _profile_restrictions(profile):
+    if profile is None:
         return None
-    slug_len = len(slug)
-    for path in IMAGES_DIR.iterdir():
-        if not path.is_file():
-            continue
-        stem = path.stem
-        stem_norm = re.sub(r"[^a-z0-9]+", "", stem.lower())
-        if stem_norm == slug:
-            return path.name
-        if slug_len >= 10 and stem_norm in slug:
-            return path.name
-        if len(stem_norm) >= 10 and slug in stem_norm:
-            return path.name
+    dr = getattr(profile, "dietary_restrictions", None)
+    if isinstance(dr, list) and dr:
+        return [r for r in dr if r]
     return None
 
 
-def _get_cell(row, norm_key):
-    for orig in row:
-        if _normalize_header(orig) == norm_key:
-            v = row.get(orig)
-            return v if v is not None else ""
-    for orig in row:
-        if norm_key == "calories" and "Calories" in orig:
-            return row.get(orig) or ""
-        if norm_key == "protein_g" and "Protein" in orig:
-            return row.get(orig) or ""
-        if norm_key == "carbs_g" and "Carbohydrates" in orig:
-            return row.get(orig) or ""
-        if norm_key == "fat_g" and "Fat" in orig:
-            return row.get(orig) or ""
-        if norm_key == "fiber_g" and "Fiber" in orig:
-            return row.get(orig) or ""
-        if norm_key == "sodium_mg" and "Sodium" in orig:
-            return row.get(orig) or ""
-    return ""
-
-
-def _parse_number(s):
-    if s is None or s == "":
-        return None
-    text = str(s).strip().replace(",", ".")
-    if "-" in text and not text.startswith("-"):
-        text = text.split("-")[0].strip()
-    try:
-        return float(text)
-    except ValueError:
-        return None
+# what the Learn page card grid needs, no ingredients/steps text
+SUMMARY_FIELDS = (
+    "slug", "title", "category", "image_filename", "image_url", "calories",
+    "minutes", "serving_size", "dietary_tags",
+)
+MAX_PAGE_SIZE = 200
 
 
-def _parse_recipe_row(row, category):
-    title = _get_cell(row, "Recipe Title")
-    title = (title or row.get("Recipe Title", "")).strip()
-    if not title:
+def _resolve_fields(fields):
+    if fields is None or fields == "full":
         return None
+    if fields == "summary":
+        return SUMMARY_FIELDS
+    names = tuple(f.strip() for f in fields.split(",") if f.strip())
+    unknown = [f for f in names if f not in RECIPE_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown recipe fields: {', '.join(unknown)}")
+    return names
 
-    serving = _get_cell(row, "Serving Size")
-    minutes_raw = _get_cell(row, "Total Preparation Time (min)")
-    ingredients = _get_cell(row, "Ingredients") or row.get("Ingredients", "")
-    steps = _get_cell(row, "Steps") or row.get("Steps", "")
-    calories_raw = _get_cell(row, "calories") or row.get("Total Calories (cal) Per Serving") or row.get("Total Calories Per Serving (cal)") or row.get("Total Calories (cal)", "")
-    protein = _get_cell(row, "protein_g") or ""
-    carbs = _get_cell(row, "carbs_g") or ""
-    fat = _get_cell(row, "fat_g") or ""
-    fiber = _get_cell(row, "fiber_g") or ""
-    sodium = _get_cell(row, "sodium_mg") or ""
 
+def _list_etag(catalog, user_restrictions, request):
+    # the body depends on the catalog, the user's restriction mask and the query params
+    # (minus user_email, which only matters through the mask)
+    params = sorted((k, v) for k, v in request.query_params.multi_items() if k != "user_email")
+    params_hash = hashlib.sha256(repr(params).encode()).hexdigest()[:12]
+    mask = mask_from_restrictions(user_restrictions)
+    return f'"{catalog.etag_base}-{mask:x}-{params_hash}"'
+
+
+def _project(recipe, field_names):
+    if field_names is None:
+        return recipe.to_dict()
+    return recipe.to_dict(field_names)
+
+
+@router.get("")
+def list_recipes(
+    request: Request,
+    response: Response,
+    user_email: str | None = Query(None),
+    fields: str | None = Query(None, description="summary, full, or a comma separated list of fields"),
+    limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    category: str | None = Query(None),
+    max_minutes: float | None = Query(None, ge=0),
+    min_calories: float | None = Query(None),
+    max_calories: float | None = Query(None),
+    min_protein: float | None = Query(None),
+    max_protein: float | None = Query(None),
+    min_carbs: float | None = Query(None),
+    max_carbs: float | None = Query(None),
+    min_fat: float | None = Query(None),
+    max_fat: float | None = Query(None),
+    db: Session = Depends(get_db),
+):
+    field_names = _resolve_fields(fields)
+    user_restrictions = _get_user_restrictions(db, user_email)
+    catalog = recipe_catalog.get_catalog()
+
+    # Last-Modified only tracks the csvs, a profile edit can change a user's list without
+    # touching them, so per-user responses rely on the ETag alone
+    last_modified = None if user_email else catalog.last_modified
+    headers = cache_headers(_list_etag(catalog, user_restrictions, request), last_modified)
+    if is_not_modified(request, headers["ETag"], last_modified):
+        return not_modified_response(headers)
+    response.headers.update(headers)
+
+    recipes = catalog.select(
+        user_restrictions,
+        category=category,
+        max_minutes=max_minutes,
+        ranges={
+            "calories": (min_calories, max_calories),
+            "protein_g": (min_protein, max_protein),
+            "carbs_g": (min_carbs, max_carbs),
+            "fat_g": (min_fat, max_fat),
+        },
+    )
+
+    total = len(recipes)
+    end = total if limit is None else offset + limit
+    page = recipes[offset:end]
     return {
-        "title": title,
-        "category": category,
-        "serving_size": (serving or "").strip(),
-        "minutes": (minutes_raw or "").strip(),
-        "ingredients": (ingredients or "").strip(),
-        "steps": (steps or "").strip(),
-        "calories": _parse_number(calories_raw),
-        "protein_g": _parse_number(protein),
-        "carbs_g": _parse_number(carbs),
-        "fat_g": _parse_number(fat),
-        "fiber_g": _parse_number(fiber),
-        "sodium_mg": _parse_number(sodium),
-        "slug": _slug(title),
+        "recipes": [_project(r, field_names) for r in page],
+        "total": total,
+        "offset": offset,
+        "next_offset": end if end < total else None,
     }
 
 
-def _load_recipe_rows():
-    recipes = []
-    for category, filename in MEAL_CSV_FILES:
-        path = CSV_DIR / filename
-        if not path.is_file():
-            continue
-        with open(path, newline="", encoding="utf-8", errors="replace") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                rec = _parse_recipe_row(row, category)
-                if rec is not None:
-                    recipes.append(rec)
-    return recipes
+@router.get("/search")
+def search_recipes(
+    request: Request,
+    response: Response,
+    q: str = Query(..., min_length=1),
+    user_email: str | None = Query(None),
+    fields: str | None = Query("summary", description="summary, full, or a comma separated list of fields"),
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+):
+    field_names = _resolve_fields(fields)
+    user_restrictions = _get_user_restrictions(db, user_email)
+    catalog = recipe_catalog.get_catalog()
 
+    headers = cache_headers(_list_etag(catalog, user_restrictions, request))
+    if is_not_modified(request, headers["ETag"]):
+        return not_modified_response(headers)
+    response.headers.update(headers)
+
+    results, total = catalog.search(q, user_restrictions, limit)
+    out = []
+    for recipe, score in results:
+        item = _project(recipe, field_names)
+        item["score"] = round(score, 4)
+        out.append(item)
+    return {"recipes": out, "total": total}
+
+
+@router.get("/recommend")
+def recommend_recipes(
+    user_email: str = Query(...),
+    k: int = Query(5, ge=1, le=50),
+    meals_left: int = Query(1, ge=1, le=6, description="split what is left across this many meals"),
+    fields: str | None = Query("summary", description="summary, full, or a comma separated list of fields"),
+    tz: str | None = Query(None, description="IANA timezone used for today's meals"),
+    db: Session = Depends(get_db),
+):
+    field_names = _resolve_fields(fields)
+    profile = db.query(Profile).filter(Profile.user_email == user_email).first()
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    todays_meals = meals_on_day(db, user_email, tz)
+
+    start = time.perf_counter()
+    catalog = recipe_catalog.get_catalog()
+    goals = recipe_recommend.macro_goals(profile)
+    remaining = goals - recipe_recommend.eaten_today(todays_meals)
+    mask = mask_from_restrictions(_profile_restrictions(profile))
+    rows, distances = recipe_recommend.recommend(catalog.macro_matrix, goals, remaining, mask, k, meals_left)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    if elapsed_ms > recipe_recommend.LATENCY_BUDGET_MS:
+        print(f"Recommend over budget: {elapsed_ms:.2f} ms for {user_email}")
 
-def _load_diet_flags():
-    path = CSV_DIR / DIET_FLAGS_FILE
-    if not path.is_file():
-        return {}
-    flags_by_key = {}
-    with open(path, newline="", encoding="utf-8", errors="replace") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            cat = (row.get("Category") or "").strip()
-            title = (row.get("Recipe Title") or "").strip()
-            key = (cat, title)
-            row_clean = {}
-            for k, v in row.items():
-                if not k:
-                    continue
-                if k.strip() in ("Category", "Recipe Title", "Net Carbs (g) Per Serving", "Notes"):
-                    continue
-                row_clean[k.strip()] = (v or "").strip()
-            flags_by_key[key] = row_clean
-    return flags_by_key
-
-
-def _get_dietary_tags(flags_row):
-    tags = []
-    if flags_row is None:
-        return tags
-    for csv_col, profile_label in CSV_COLUMN_TO_PROFILE.items():
-        value = (flags_row.get(csv_col) or "").strip().lower()
-        if value == "yes":
-            tags.append(profile_label)
-    return tags
-
-
-def _recipe_matches_restrictions(flags_row, user_restrictions):
-    if not user_restrictions:
-        return True
-    for rest in user_restrictions:
-        csv_col = PROFILE_TO_CSV_COLUMN.get(rest)
-        if csv_col is None:
-            continue
-        value = (flags_row or {}).get(csv_col, "").strip().lower()
-        if value != "yes":
-            return False
-    return True
-
-
-def _build_recipes_with_flags(user_restrictions=None):
-    recipes = _load_recipe_rows()
-    flags = _load_diet_flags()
     out = []
-    for r in recipes:
-        key = (r["category"], r["title"])
-        flags_row = flags.get(key)
-        if user_restrictions is not None:
-            if not _recipe_matches_restrictions(flags_row, user_restrictions):
-                continue
-        dietary_tags = _get_dietary_tags(flags_row)
-        image_filename = _find_image(r["slug"])
-        recipe_out = dict(r)
-        recipe_out["dietary_tags"] = dietary_tags
-        recipe_out["image_filename"] = image_filename
-        out.append(recipe_out)
-    return out
+    for row, dist in zip(rows.tolist(), distances.tolist()):
+        item = _project(catalog.recipes[row], field_names)
+        item["distance"] = round(dist, 4)
+        out.append(item)
+    return {
+        "recipes": out,
+        "remaining": dict(zip(("calories", "protein_g", "carbs_g", "fat_g"), [round(v, 1) for v in remaining.tolist()])),
+        "elapsed_ms": round(elapsed_ms, 3),
+        "budget_ms": recipe_recommend.LATENCY_BUDGET_MS,
+    }
 
 
-@router.get("")
-def list_recipes(
+@router.get("/restrictions/counts")
+def get_restriction_counts(
     user_email: str | None = Query(None),
+    restrictions: list[str] | None = Query(None),
     db: Session = Depends(get_db),
 ):
-    user_restrictions = None
-    if user_email:
-        profile = db.query(Profile).filter(Profile.user_email == user_email).first()
-        if profile is not None:
-            dr = getattr(profile, "dietary_restrictions", None)
-            if isinstance(dr, list) and dr:
-                user_restrictions = [r for r in dr if r]
-    recipes = _build_recipes_with_flags(user_restrictions)
-    return {"recipes": recipes}
+    """How many recipes survive the given restrictions, and how many would survive adding one more."""
+    if restrictions is None:
+        restrictions = _get_user_restrictions(db, user_email) or []
+    catalog = recipe_catalog.get_catalog()
+    mask = mask_from_restrictions(restrictions)
+    counts = catalog.restriction_counts
+    return {
+        "restrictions": [r for r in restrictions if r in PROFILE_TO_BIT],
+        "total": len(catalog.recipes),
+        "matching": counts[mask],
+        "if_added": {label: counts[mask | bit] for label, bit in PROFILE_TO_BIT.items() if not mask & bit},
+    }
+
+
+@router.get("/catalog/metrics")
+def get_catalog_metrics():
+    metrics = recipe_catalog.catalog_metrics()
+    metrics["image_cache"] = image_derivatives.cache_stats()
+    return metrics
+
+
+@router.post("/catalog/reload")
+def reload_recipe_catalog():
+    catalog = recipe_catalog.reload_catalog()
+    return {"ok": True, "version": catalog.version, "recipe_count": len(catalog.recipes)}
+
+
+@router.get("/catalog/images")
+def get_catalog_image_report():
+    return recipe_catalog.image_report()
 
 
 @router.get("/images/{filename:path}")
-def serve_recipe_image(filename: str):
+def serve_recipe_image(
+    request: Request,
+    filename: str,
+    v: str | None = Query(None),
+    w: int | None = Query(None, ge=1, le=4096),
+    h: int | None = Query(None, ge=1, le=4096),
+):
     if ".." in filename or "/" in filename or "\\" in filename:
         raise HTTPException(status_code=400, detail="Invalid filename")
     path = IMAGES_DIR / filename
     if not path.is_file():
         raise HTTPException(status_code=404, detail="Image not found")
-    return FileResponse(path)
+
+    digest = image_index.content_hash(filename)
+    last_modified = path.stat().st_mtime
+    cache_control = IMMUTABLE_CACHE_CONTROL if v is not None and v == digest else REVALIDATE_CACHE_CONTROL
+
+    if w is None and h is None:
+        headers = cache_headers(f'"{digest}"', last_modified, cache_control)
+        if is_not_modified(request, headers["ETag"], last_modified):
+            return not_modified_response(headers)
+        return FileResponse(path, headers=headers)
+
+    # resized copies are re-encoded in the best format the browser accepts
+    fmt = image_derivatives.negotiate_format(request.headers.get("accept"))
+    width, height = image_derivatives.snap_size(w), image_derivatives.snap_size(h)
+    headers = cache_headers(f'"{digest}-{width or 0}x{height or 0}.{fmt}"', last_modified, cache_control)
+    headers["Vary"] = "Accept"
+    if is_not_modified(request, headers["ETag"], last_modified):
+        return not_modified_response(headers)
+    derivative, _ = image_derivatives.get_derivative(filename, width, height, fmt)
+    if derivative is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return Response(derivative, media_type=image_derivatives.media_type(fmt), headers=headers)
+
+
+@router.get("/{slug}")
+def get_recipe(slug: str, request: Request, response: Response):
+    catalog = recipe_catalog.get_catalog()
+    recipe = catalog.by_slug.get(slug)
+    if recipe is None:
+        raise HTTPException(status_code=404, detail="Recipe not found")
+
+    headers = cache_headers(f'"{catalog.etag_base}-{slug}"', catalog.last_modified)
+    if is_not_modified(request, headers["ETag"], catalog.last_modified):
+        return not_modified_response(headers)
+    response.headers.update(headers)
+    return recipe.to_dict()
@@ -0,0 +1,18 @@
+from pydantic import BaseModel, Field
+from typing import Optional, List
+
+class MealItem(BaseModel):
+    food_name: str = Field(min_length=1, max_length=200)
+    meal_type: Optional[str] = None
+    calories: float = Field(0, ge=0, le=20000)
+    protein: float = Field(0, ge=0, le=2000)
+    carbs: float = Field(0, ge=0, le=2000)
+    fats: float = Field(0, ge=0, le=2000)
+    fiber: float = Field(0, ge=0, le=500)
+    sodium: float = Field(0, ge=0, le=100000)
+
+class MealBatch(BaseModel):
+    user_email: str = Field(min_length=1)
+    timezone: Optional[str] = None
+    # validated one by one so a bad item doesn't reject the rest
+    items: List[dict] = Field(min_length=1, max_length=100)
@@ -0,0 +1,245 @@
+"""Load test for the chat routes against a running server.
+
+Start the server on the offline stub so no Gemini quota is used, then drive it:
+
+    LLM_BACKEND=stub LLM_STUB_LATENCY_MS=lognormal:600:0.5 uvicorn app.main:app --port 8000
+    python -m app.services.chat_load --users 20 --turns 10 --stream
+
+Each virtual user signs up with a profile, then holds one conversation: questions,
+requests to log a meal (the stub answers those with a LOG_MEAL block) and the odd
+photo upload, with --think-ms between turns. The report has p50/p95/p99 latency and
+errors per route, throughput, database queries per chat turn (from /metrics/db) and
+the llm client metrics. Afterwards each user's log is checked against the meals the
+chat should have auto-logged (after waiting for the background writes to settle),
+then reset. The load-test users and profiles are left
+in place under a per-run email prefix.
+
+Repeated runs send the same prompts, so start the server with LLM_CACHE_SIZE=0 to
+measure without the reply cache.
+"""
+import argparse
+import io
+import json
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from PIL import Image
+
+QUESTIONS = [
+    "What should I eat for dinner tonight?",
+    "Is oatmeal a good breakfast for my goals?",
+    "How am I doing on protein today?",
+    "Give me a cheap high-protein snack idea.",
+    "What can I cook with chicken, rice and spinach?",
+    "Are there any foods I should avoid with my restrictions?",
+]
+LOG_REQUESTS = [
+    "Please log a turkey sandwich for lunch.",
+    "I just ate an apple, can you log it?",
+    "Log a grilled chicken salad for dinner please.",
+]
+
+
+def percentiles(samples):
+    if not samples:
+        return {"p50": None, "p95": None, "p99": None}
+    ordered = sorted(samples)
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 1)
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99)}
+
+
+def sample_photo():
+    img = Image.radial_gradient("L").resize((1600, 1200)).convert("RGB")
+    out = io.BytesIO()
+    img.save(out, "JPEG", quality=85)
+    return out.getvalue()
+
+
+class Results:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = {}  # route -> [ms]
+        self.errors = {}  # route -> count
+        self.expected_meals = {}  # email -> meals the chat should have logged
+        self.pending_logs = []  # pending-log ids returned by the chat
+
+    def record(self, route, ms, ok):
+        with self._lock:
+            self.latency.setdefault(route, []).append(ms)
+            if not ok:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+    def expect_meal(self, email, pending_log_id):
+        with self._lock:
+            self.expected_meals[email] = self.expected_meals.get(email, 0) + 1
+            self.pending_logs.append(pending_log_id)
+
+
+def _send_message(http, base, payload, stream):
+    """(reply, conversation_id, pending_log_id, error code or None)"""
+    if not stream:
+        data = http.post(f"{base}/chat/message", json=payload, timeout=120).json()
+        return data.get("reply"), data.get("conversation_id"), data.get("pending_log_id"), data.get("error")
+    with http.post(f"{base}/chat/message/stream", json=payload, stream=True, timeout=120) as res:
+        event = None
+        for line in res.iter_lines(decode_unicode=True):
+            if line.startswith("event: "):
+                event = line[7:]
+            elif line.startswith("data: ") and event in ("done", "error"):
+                data = json.loads(line[6:])
+                error = data.get("error") or (event == "error" and "error")
+                return data.get("reply"), data.get("conversation_id"), data.get("pending_log_id"), error
+    return None, None, None, "error"
+
+
+def run_user(base, email, args, photo, results, rng):
+    http = requests.Session()
+    conversation_id = None
+    tz = "UTC"
+    route = "/chat/message/stream" if args.stream else "/chat/message"
+    for turn in range(args.turns):
+        roll = rng.random()
+        start = time.perf_counter()
+        if roll < args.photo_share:
+            try:
+                res = http.post(
+                    f"{base}/chat/upload/photo",
+                    files={"photo": ("meal.jpg", photo, "image/jpeg")},
+                    data={"user_email": email, "timezone": tz},
+                    timeout=120,
+                )
+                ok = res.status_code == 200 and not res.json().get("error")
+            except (requests.RequestException, ValueError):
+                ok = False
+            results.record("/chat/upload/photo", (time.perf_counter() - start) * 1000, ok)
+        else:
+            is_log = roll < args.photo_share + args.log_share
+            message = rng.choice(LOG_REQUESTS if is_log else QUESTIONS)
+            payload = {"message": message, "user_email": email, "timezone": tz, "conversation_id": conversation_id}
+            try:
+                reply, conversation_id, pending_log_id, error = _send_message(http, base, payload, args.stream)
+            except (requests.RequestException, ValueError):
+                reply, pending_log_id, error = None, None, "error"
+            ok = reply is not None and not error
+            results.record(route, (time.perf_counter() - start) * 1000, ok)
+            if ok and is_log and pending_log_id:
+                results.expect_meal(email, pending_log_id)
+        if args.think_ms:
+            time.sleep(rng.uniform(0.5, 1.5) * args.think_ms / 1000)
+
+
+def setup_user(base, email, index):
+    """Sign up with a full profile, so the server works out a calorie goal like it does for real users."""
+    http = requests.Session()
+    http.post(f"{base}/users/create", json={"email": email, "password": "load-test"}, timeout=30).raise_for_status()
+    http.post(f"{base}/profile/", json={
+        "user_email": email,
+        "name": f"Load Tester {index}",
+        "birthday_text": f"0{1 + index % 9}/15/{1970 + index % 30}",
+        "height_text": f"5'{4 + index % 8}\"",
+        "weight_text": f"{140 + 5 * (index % 10)} lb",
+        "sex_at_birth": "Female" if index % 2 else "Male",
+        "steps_range": "Some (5,000–7,000 steps)",
+        "active_days_per_week": "1–2 days",
+        "dietary_restrictions": ["Vegetarian"] if index % 3 == 0 else [],
+    }, timeout=30).raise_for_status()
+
+
+def wait_for_logs(base, pending_ids, timeout=30):
+    """{status: count} once no auto-log is still pending (or the timeout passes)."""
+    counts = {}
+    deadline = time.monotonic() + timeout
+    remaining = list(pending_ids)
+    while remaining and time.monotonic() < deadline:
+        still = []
+        for pending_id in remaining:
+            res = requests.get(f"{base}/chat/log/{pending_id}", timeout=30)
+            status = res.json().get("status") if res.status_code == 200 else "unknown"
+            if status == "pending":
+                still.append(pending_id)
+            else:
+                counts[status] = counts.get(status, 0) + 1
+        remaining = still
+        if remaining:
+            time.sleep(0.2)
+    if remaining:
+        counts["pending"] = len(remaining)
+    return counts
+
+
+def check_logs(base, results, emails):
+    """Users whose auto-logged meal count doesn't match what the chat confirmed."""
+    mismatched = {}
+    for email in emails:
+        meals = requests.get(f"{base}/meals/today", params={"user_email": email, "tz": "UTC"}, timeout=30).json()
+        expected = results.expected_meals.get(email, 0)
+        if len(meals) != expected:
+            mismatched[email] = {"expected": expected, "found": len(meals)}
+        requests.delete(f"{base}/meals/reset", params={"user_email": email}, timeout=30)
+    return mismatched
+
+
+def total_queries(base):
+    stats = requests.get(f"{base}/metrics/db", timeout=30).json()
+    return sum(engine.get("queries", 0) for engine in stats.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the chat routes against a running server.")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--users", type=int, default=20, help="concurrent virtual users")
+    parser.add_argument("--turns", type=int, default=10, help="chat turns per user")
+    parser.add_argument("--think-ms", type=float, default=0, help="mean pause between a user's turns")
+    parser.add_argument("--log-share", type=float, default=0.25, help="share of turns asking to log a meal")
+    parser.add_argument("--photo-share", type=float, default=0.1, help="share of turns uploading a photo")
+    parser.add_argument("--stream", action="store_true", help="use /chat/message/stream instead of /chat/message")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    base = args.url.rstrip("/")
+    run_id = uuid.uuid4().hex[:8]
+    emails = [f"load-{run_id}-{i}@example.com" for i in range(args.users)]
+    for i, email in enumerate(emails):
+        setup_user(base, email, i)
+
+    photo = sample_photo()
+    results = Results()
+    queries_before = total_queries(base)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.users) as pool:
+        futures = [
+            pool.submit(run_user, base, email, args, photo, results, random.Random(args.seed * 1000 + i))
+            for i, email in enumerate(emails)
+        ]
+        for f in futures:
+            f.result()
+    elapsed = time.perf_counter() - start
+    queries = total_queries(base) - queries_before
+
+    requests_made = sum(len(v) for v in results.latency.values())
+    print(f"{args.users} users x {args.turns} turns, {requests_made} requests in {elapsed:.1f} s "
+          f"= {requests_made / elapsed:.1f} req/s")
+    for route, samples in sorted(results.latency.items()):
+        p = percentiles(samples)
+        print(f"  {route:22} n={len(samples):5}  errors={results.errors.get(route, 0):4}  "
+              f"p50={p['p50']} ms  p95={p['p95']} ms  p99={p['p99']} ms")
+    print(f"DB queries: {queries} total, {queries / max(requests_made, 1):.1f} per request")
+
+    llm = requests.get(f"{base}/chat/metrics", timeout=30).json().get("llm", {})
+    print(f"LLM client: {json.dumps(llm)}")
+
+    print(f"Background auto-logs: {json.dumps(wait_for_logs(base, results.pending_logs))}")
+    mismatched = check_logs(base, results, emails)
+    expected = sum(results.expected_meals.values())
+    if mismatched:
+        print(f"Auto-log MISMATCH for {len(mismatched)} users: {json.dumps(mismatched)}")
+    else:
+        print(f"Auto-log OK: {expected} meals logged as confirmed")
+
+
+if __name__ == "__main__":
+    main()
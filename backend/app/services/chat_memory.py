@@ -0,0 +1,143 @@
+"""Server-side chat history with a token budget.
+
+A conversation's prompt history is the last few messages verbatim (at most
+CHAT_RECENT_MESSAGES, and within CHAT_HISTORY_TOKEN_BUDGET) plus a rolling summary
+of everything older. The summary is stored on the conversation and only rebuilt once
+CHAT_SUMMARY_REFRESH_MESSAGES messages have aged out of the verbatim window since it
+was last written; until then those few messages stay in the prompt verbatim.
+
+Only the messages the summary doesn't cover are read back, newest
+MAX_LOADED_MESSAGES at most. That is more than a healthy conversation ever has
+outstanding; if summaries keep failing, the oldest of them drop out unsummarized.
+"""
+import os
+import uuid
+
+from sqlalchemy import func
+
+from app.models.conversations import ChatMessage, Conversation
+
+HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "1500"))
+RECENT_MESSAGES = int(os.getenv("CHAT_RECENT_MESSAGES", "8"))
+SUMMARY_REFRESH_MESSAGES = int(os.getenv("CHAT_SUMMARY_REFRESH_MESSAGES", "6"))
+# verbatim window + a pending refresh + the turn since, with room for a failed summary
+MAX_LOADED_MESSAGES = RECENT_MESSAGES + 2 * SUMMARY_REFRESH_MESSAGES + 2
+
+ROLE_LABELS = {"user": "User", "model": "Model"}
+
+
+def estimate_tokens(text):
+    # ~4 characters per token for English, close enough for budgeting
+    return len(text or "") // 4 + 1
+
+
+def render_messages(messages):
+    return "".join(f"\n{ROLE_LABELS.get(m.role, 'Model')}: {m.body}" for m in messages)
+
+
+def recent_cut(messages, budget=HISTORY_TOKEN_BUDGET, keep=RECENT_MESSAGES):
+    """Index of the first message kept verbatim: newest first until keep or budget runs out."""
+    used = 0
+    cut = len(messages)
+    while cut > 0 and len(messages) - cut < keep:
+        cost = estimate_tokens(messages[cut - 1].body)
+        if used + cost > budget and cut < len(messages):
+            break
+        used += cost
+        cut -= 1
+    return cut
+
+
+# sync helpers, called through AsyncSession.run_sync from the chat routes
+
+def load(db, conversation_id, user_email):
+    """(conversation id, summary, start, messages).
+
+    messages are the ones the summary doesn't cover, from message number `start` on.
+
+    Starts a new conversation when id is None or unknown (e.g. a client holding an id
+    from a wiped database). Raises LookupError for an id that belongs to someone else.
+    """
+    conv = db.get(Conversation, conversation_id) if conversation_id else None
+    if conv is None:
+        conv = Conversation(id=uuid.uuid4().hex, user_email=user_email, summary_through=0)
+        db.add(conv)
+        db.commit()
+        return conv.id, None, 0, []
+    if conv.user_email != user_email:
+        raise LookupError("Conversation not found")
+    total = (
+        db.query(func.count(ChatMessage.id))
+        .filter(ChatMessage.conversation_id == conversation_id)
+        .scalar()
+    )
+    through = min(conv.summary_through or 0, total)
+    start = max(through, total - MAX_LOADED_MESSAGES)
+    messages = (
+        db.query(ChatMessage)
+        .filter(ChatMessage.conversation_id == conversation_id)
+        .order_by(ChatMessage.id)
+        .offset(start)
+        .limit(MAX_LOADED_MESSAGES)
+        .all()
+    )
+    return conv.id, conv.summary, start, messages
+
+
+def save_summary(db, conversation_id, summary, through):
+    db.query(Conversation).filter(Conversation.id == conversation_id).update(
+        {Conversation.summary: summary, Conversation.summary_through: through},
+        synchronize_session=False,
+    )
+    db.commit()
+
+
+def append(db, conversation_id, user_message, reply):
+    db.add_all([
+        ChatMessage(conversation_id=conversation_id, role="user", body=user_message),
+        ChatMessage(conversation_id=conversation_id, role="model", body=reply),
+    ])
+    db.commit()
+
+
+async def build_history(db, conversation_id, user_email, summarize):
+    """(conversation id, history text for the prompt).
+
+    summarize(previous_summary, transcript) -> new summary text, only awaited when the
+    stored summary is stale. If it fails the old summary is kept and retried next turn.
+    """
+    conversation_id, summary, start, messages = await db.run_sync(load, conversation_id, user_email)
+    # end the read transaction so the pooled connection isn't held while summarize waits
+    # on the model; save_summary starts a fresh one
+    await db.commit()
+    cut = recent_cut(messages)
+    through = 0
+
+    if cut >= SUMMARY_REFRESH_MESSAGES:
+        try:
+            summary = await summarize(summary, render_messages(messages[:cut]))
+            through = cut
+            await db.run_sync(save_summary, conversation_id, summary, start + cut)
+        except Exception as e:
+            print(f"Chat summary error: {e}")
+
+    # messages the summary doesn't cover yet stay verbatim (fewer than the refresh count)
+    history = render_messages(messages[through:])
+    if summary:
+        history = f"\n[EARLIER IN THIS CONVERSATION (summary)]\n{summary}\n{history}"
+    return conversation_id, history
+
+
+def trim_client_history(history, budget=HISTORY_TOKEN_BUDGET, keep=RECENT_MESSAGES):
+    """Budgeted tail of a client-sent history list, for clients without a conversation id."""
+    out = []
+    used = 0
+    for msg in reversed(history or []):
+        if len(out) >= keep:
+            break
+        cost = estimate_tokens(msg.get("body", ""))
+        if out and used + cost > budget:
+            break
+        used += cost
+        out.append(msg)
+    return list(reversed(out))
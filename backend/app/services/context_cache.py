@@ -0,0 +1,91 @@
+"""Per-user cache of the rendered chat context (profile block + today's log).
+
+LRU with a TTL, keyed by (user, timezone). Writes that change what the context shows
+(profile saves, meal logs/deletes/resets, chat auto-logs) call invalidate(user_email),
+so in the steady state a chat turn renders the context without touching the database.
+
+The cache is per process. With several workers a write only clears the worker that
+handled it; the others catch up within CHAT_CONTEXT_CACHE_TTL seconds.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from app.services.meal_days import local_today, resolve_timezone
+
+MAX_ENTRIES = int(os.getenv("CHAT_CONTEXT_CACHE_SIZE", "1024"))
+TTL_SECONDS = float(os.getenv("CHAT_CONTEXT_CACHE_TTL", "300"))
+
+
+class ContextCache:
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # (user, tz) -> (expires, local day, text), oldest first
+        self._versions = {}  # user -> bumped on every invalidation
+        self._lock = threading.Lock()
+        self.metrics = {"hits": 0, "misses": 0, "expired": 0, "invalidations": 0, "evictions": 0, "stale_puts": 0}
+
+    def version(self, user_email):
+        with self._lock:
+            return self._versions.get(user_email, 0)
+
+    def get(self, user_email, tz=None):
+        key = (user_email, tz)
+        # the daily log part changes at the user's midnight even without writes
+        today = local_today(resolve_timezone(tz))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.metrics["misses"] += 1
+                return None
+            expires, day, text = entry
+            if expires < time.monotonic() or day != today:
+                del self._entries[key]
+                self.metrics["expired"] += 1
+                self.metrics["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.metrics["hits"] += 1
+            return text
+
+    def put(self, user_email, tz, text, version):
+        """Store text rendered when version() returned `version`; dropped if invalidated since."""
+        today = local_today(resolve_timezone(tz))
+        with self._lock:
+            if self._versions.get(user_email, 0) != version:
+                self.metrics["stale_puts"] += 1
+                return
+            self._entries[(user_email, tz)] = (time.monotonic() + self.ttl, today, text)
+            self._entries.move_to_end((user_email, tz))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.metrics["evictions"] += 1
+
+    def invalidate(self, user_email):
+        if not user_email:
+            return
+        with self._lock:
+            self._versions[user_email] = self._versions.get(user_email, 0) + 1
+            for key in [k for k in self._entries if k[0] == user_email]:
+                del self._entries[key]
+            self.metrics["invalidations"] += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.metrics["hits"] + self.metrics["misses"]
+            return dict(
+                self.metrics,
+                entries=len(self._entries),
+                max_entries=self.max_entries,
+                ttl_seconds=self.ttl,
+                hit_rate=round(self.metrics["hits"] / lookups, 3) if lookups else None,
+            )
+
+
+context_cache = ContextCache()
+
+
+def invalidate(user_email):
+    context_cache.invalidate(user_email)
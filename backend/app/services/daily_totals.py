@@ -0,0 +1,136 @@
+"""Per-user, per-local-day nutrient totals kept in the daily_totals table.
+
+Every write path that adds or removes meals calls into here in the same transaction,
+so reading a day's totals is one row instead of summing every meal.
+
+Meals logged before daily_totals existed can be folded in with:
+
+    python -m app.services.daily_totals --rebuild --tz America/New_York
+"""
+import argparse
+
+from sqlalchemy.exc import IntegrityError
+
+from app.models.daily_totals import DailyTotal
+from app.models.meals import Meal
+from app.services.meal_days import local_date, resolve_timezone
+
+NUTRIENTS = ("calories", "protein", "carbs", "fats", "fiber", "sodium")
+
+# profile goal columns, in the same order as NUTRIENTS (no sodium goal on the profile)
+GOAL_COLUMNS = {"calories": "calorie_goal", "protein": "protein_g", "carbs": "carbs_g", "fats": "fats_g", "fiber": "fiber_g"}
+
+
+def _amount(value):
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def add_meal(db, meal, day, sign=1):
+    """Add (sign=1) or remove (sign=-1) one meal's nutrients from the user's total for day.
+
+    Adding records day on the meal as its logged_day. Does not commit.
+    """
+    if sign > 0:
+        meal.logged_day = day
+    amounts = {k: sign * _amount(getattr(meal, k)) for k in NUTRIENTS}
+    add_amounts(db, meal.user_email, day, amounts, sign)
+
+
+def add_amounts(db, user_email, day, amounts, meal_count):
+    """Add summed nutrients for meal_count meals (negative to remove) to one day's row.
+
+    Increments happen in SQL so concurrent writers don't lose updates. Does not commit.
+    """
+    changes = {getattr(DailyTotal, k): getattr(DailyTotal, k) + amounts[k] for k in NUTRIENTS}
+    changes[DailyTotal.meal_count] = DailyTotal.meal_count + meal_count
+    query = db.query(DailyTotal).filter(DailyTotal.user_email == user_email, DailyTotal.day == day)
+    if query.update(changes, synchronize_session=False):
+        return
+    if meal_count < 0:
+        # the meal was counted under some other day; rebuild puts the totals right
+        print(f"Daily totals: no row to subtract from for {user_email} on {day}")
+        return
+
+    row = DailyTotal(user_email=user_email, day=day, meal_count=meal_count, **amounts)
+    try:
+        # another request may have created the row since the update above
+        with db.begin_nested():
+            db.add(row)
+    except IntegrityError:
+        query.update(changes, synchronize_session=False)
+
+
+def clear_user(db, user_email):
+    db.query(DailyTotal).filter(DailyTotal.user_email == user_email).delete(synchronize_session=False)
+
+
+def get_totals(db, user_email, day):
+    row = db.query(DailyTotal).filter(DailyTotal.user_email == user_email, DailyTotal.day == day).first()
+    totals = {k: round(getattr(row, k), 1) if row else 0.0 for k in NUTRIENTS}
+    totals["meal_count"] = row.meal_count if row else 0
+    return totals
+
+
+def summarize(totals, profile):
+    """(goals, remaining) against the profile; None where the profile has no goal."""
+    goals = {}
+    remaining = {}
+    for k in NUTRIENTS:
+        column = GOAL_COLUMNS.get(k)
+        goal = getattr(profile, column, None) if (profile is not None and column) else None
+        goals[k] = goal
+        remaining[k] = round(goal - totals[k], 1) if goal is not None else None
+    return goals, remaining
+
+
+def rebuild(db, tz_name=None, user_email=None):
+    """Recompute daily_totals from the meals table. Returns rows written.
+
+    Meals go on their logged_day; older meals without one on their day in tz_name.
+    """
+    tz = resolve_timezone(tz_name)
+    meals = db.query(Meal)
+    old = db.query(DailyTotal)
+    if user_email:
+        meals = meals.filter(Meal.user_email == user_email)
+        old = old.filter(DailyTotal.user_email == user_email)
+    old.delete(synchronize_session=False)
+
+    sums = {}
+    for meal in meals.yield_per(1000):
+        if meal.created_at is None:
+            continue
+        key = (meal.user_email, meal.logged_day or local_date(meal.created_at, tz))
+        row = sums.setdefault(key, {**dict.fromkeys(NUTRIENTS, 0.0), "meal_count": 0})
+        for k in NUTRIENTS:
+            row[k] += _amount(getattr(meal, k))
+        row["meal_count"] += 1
+
+    db.add_all(DailyTotal(user_email=email, day=day, **row) for (email, day), row in sums.items())
+    db.commit()
+    return len(sums)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild daily_totals from logged meals.")
+    parser.add_argument("--rebuild", action="store_true", required=True)
+    parser.add_argument("--tz", default=None, help="IANA timezone for meals without a logged day (default DEFAULT_TIMEZONE)")
+    parser.add_argument("--user-email", default=None, help="only this user")
+    args = parser.parse_args()
+
+    from app.database import SessionLocal, create_tables
+
+    create_tables()
+    db = SessionLocal()
+    try:
+        count = rebuild(db, args.tz, args.user_email)
+    finally:
+        db.close()
+    print(f"Rebuilt {count} daily totals")
+
+
+if __name__ == "__main__":
+    main()
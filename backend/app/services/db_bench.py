@@ -0,0 +1,106 @@
+"""Concurrent throughput of the chat context query, sync Session vs AsyncSession.
+
+Runs --requests context builds with --concurrency in flight on one event loop, the way
+a single uvicorn worker serves them, and reports throughput plus the worst stall seen
+by a 1 ms heartbeat task (how long other requests on the worker would have waited).
+
+    python -m app.services.db_bench --requests 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import time
+
+from app.database import AsyncSessionLocal, SessionLocal, create_tables
+from app.models.meals import Meal
+from app.models.profile import Profile
+from app.models.user import User
+from app.routers.chat import get_user_context
+
+BENCH_EMAIL = "db-bench@example.com"
+
+
+def _seed(meals):
+    db = SessionLocal()
+    try:
+        if not db.get(User, BENCH_EMAIL):
+            db.add(User(email=BENCH_EMAIL, password="-"))
+        if not db.query(Profile).filter(Profile.user_email == BENCH_EMAIL).first():
+            db.add(Profile(user_email=BENCH_EMAIL, name="Bench", calorie_goal=2000))
+        db.query(Meal).filter(Meal.user_email == BENCH_EMAIL).delete()
+        db.add_all(Meal(user_email=BENCH_EMAIL, food_name=f"Food {i}", calories=100) for i in range(meals))
+        db.commit()
+    finally:
+        db.close()
+
+
+def _cleanup():
+    db = SessionLocal()
+    try:
+        db.query(Meal).filter(Meal.user_email == BENCH_EMAIL).delete()
+        db.query(Profile).filter(Profile.user_email == BENCH_EMAIL).delete()
+        db.query(User).filter(User.email == BENCH_EMAIL).delete()
+        db.commit()
+    finally:
+        db.close()
+
+
+async def _sync_request():
+    # what the routes did before: a sync Session called straight from async def
+    db = SessionLocal()
+    try:
+        get_user_context(db, BENCH_EMAIL)
+    finally:
+        db.close()
+
+
+async def _async_request():
+    async with AsyncSessionLocal() as db:
+        await db.run_sync(get_user_context, BENCH_EMAIL)
+
+
+async def _run(make_request, requests, concurrency):
+    stop = asyncio.Event()
+    worst_lag = 0.0
+
+    async def heartbeat():
+        nonlocal worst_lag
+        while not stop.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            worst_lag = max(worst_lag, time.perf_counter() - start - 0.001)
+
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with sem:
+            await make_request()
+
+    beat = asyncio.create_task(heartbeat())
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await beat
+    return requests / elapsed, worst_lag * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sync vs async sessions for the chat context.")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--meals", type=int, default=5, help="meals logged today for the bench user")
+    args = parser.parse_args()
+
+    create_tables()
+    _seed(args.meals)
+    try:
+        for name, make_request in (("sync Session", _sync_request), ("AsyncSession", _async_request)):
+            rps, lag_ms = asyncio.run(_run(make_request, args.requests, args.concurrency))
+            print(f"{name:13} {rps:8.0f} req/s   worst event loop stall {lag_ms:7.1f} ms")
+    finally:
+        _cleanup()
+
+
+if __name__ == "__main__":
+    main()
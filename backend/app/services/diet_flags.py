@@ -0,0 +1,65 @@
+PROFILE_TO_CSV_COLUMN = {
+    "Dairy-free": "Dairy-Free",
+    "Egg-free": "Egg-Free",
+    "Gluten-free": "Gluten-Free",
+    "Keto": "Keto",
+    "Low-carb": "Low-Carb",
+    "Low-fat": "Low-Fat",
+    "Low-salt": "Low-Salt",
+    "Low-sugar": "Low-Sugar",
+    "No seafood": "No Seafood",
+    "Paleo": "Paleo",
+    "Soy-free": "Soy-Free",
+    "Vegan": "Vegan",
+    "Vegetarian": "Vegetarian",
+}
+
+CSV_COLUMN_TO_PROFILE = {}
+for profile_label, csv_col in PROFILE_TO_CSV_COLUMN.items():
+    CSV_COLUMN_TO_PROFILE[csv_col] = profile_label
+
+# one bit per diet flag, in the order of PROFILE_TO_CSV_COLUMN
+PROFILE_TO_BIT = {}
+for i, profile_label in enumerate(PROFILE_TO_CSV_COLUMN):
+    PROFILE_TO_BIT[profile_label] = 1 << i
+
+ALL_FLAGS_MASK = (1 << len(PROFILE_TO_BIT)) - 1
+
+
+def mask_from_flags_row(flags_row) -> int:
+    """Encode a diet-flags csv row ({"Vegan": "Yes", ...}) as an int bitmask."""
+    mask = 0
+    if not flags_row:
+        return mask
+    for csv_col, profile_label in CSV_COLUMN_TO_PROFILE.items():
+        value = (flags_row.get(csv_col) or "").strip().lower()
+        if value == "yes":
+            mask |= PROFILE_TO_BIT[profile_label]
+    return mask
+
+
+def mask_from_restrictions(restrictions) -> int:
+    """Encode a profile's dietary_restrictions list. Unknown labels are ignored, like before."""
+    mask = 0
+    for rest in restrictions or []:
+        mask |= PROFILE_TO_BIT.get(rest, 0)
+    return mask
+
+
+def tags_from_mask(mask: int) -> list:
+    return [label for label, bit in PROFILE_TO_BIT.items() if mask & bit]
+
+
+def superset_counts(masks) -> list:
+    """counts[m] = number of recipes whose flags include every bit of m.
+
+    Sum over supersets, 13 passes over the 8192 possible combinations.
+    """
+    counts = [0] * (ALL_FLAGS_MASK + 1)
+    for m in masks:
+        counts[m] += 1
+    for bit in PROFILE_TO_BIT.values():
+        for m in range(ALL_FLAGS_MASK + 1):
+            if not m & bit:
+                counts[m] += counts[m | bit]
+    return counts
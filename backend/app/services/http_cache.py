@@ -0,0 +1,43 @@
+from email.utils import formatdate, parsedate_to_datetime
+
+from fastapi import Request, Response
+
+# images requested with the ?v=<content hash> from the catalog never change
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+
+def http_date(timestamp: float) -> str:
+    return formatdate(timestamp, usegmt=True)
+
+
+def is_not_modified(request: Request, etag: str, last_modified: float | None = None) -> bool:
+    """True when the client's If-None-Match / If-Modified-Since says its copy is current.
+
+    If-None-Match wins when both are sent, same as RFC 9110.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [t.strip() for t in if_none_match.split(",")]
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        # http dates only have second precision
+        return int(last_modified) <= since
+    return False
+
+
+def cache_headers(etag: str, last_modified: float | None = None, cache_control: str = REVALIDATE_CACHE_CONTROL) -> dict:
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+def not_modified_response(headers: dict) -> Response:
+    return Response(status_code=304, headers=headers)
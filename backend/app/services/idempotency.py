@@ -0,0 +1,45 @@
+"""Idempotency-Key support: the first response for a key is stored and replayed on retries.
+
+Keys are scoped per user and expire after IDEMPOTENCY_TTL_HOURS.
+"""
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+from app.models.idempotency import IdempotencyKey
+
+TTL_HOURS = float(os.getenv("IDEMPOTENCY_TTL_HOURS", "24"))
+
+
+def request_hash(payload):
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _cutoff():
+    return datetime.now(timezone.utc) - timedelta(hours=TTL_HOURS)
+
+
+def lookup(db, user_email, key):
+    return (
+        db.query(IdempotencyKey)
+        .filter(IdempotencyKey.user_email == user_email, IdempotencyKey.key == key,
+                IdempotencyKey.created_at >= _cutoff())
+        .first()
+    )
+
+
+def replay(stored, req_hash):
+    """The stored response, or ValueError if the key was used for a different request."""
+    if stored.request_hash != req_hash:
+        raise ValueError("Idempotency-Key was already used for a different request")
+    return json.loads(stored.response)
+
+
+def save(db, user_email, key, req_hash, response):
+    """Store the response in the caller's transaction. Does not commit."""
+    # expired keys (including an old use of this one) make room for the new row
+    db.query(IdempotencyKey).filter(
+        IdempotencyKey.user_email == user_email, IdempotencyKey.created_at < _cutoff()
+    ).delete(synchronize_session=False)
+    db.add(IdempotencyKey(user_email=user_email, key=key, request_hash=req_hash, response=json.dumps(response)))
@@ -0,0 +1,237 @@
+"""Resized / re-encoded copies of recipe images, cached on disk.
+
+Derivatives are keyed by the source image's content hash, the requested box and the
+output format, so a changed source never serves a stale copy. The cache directory is
+bounded (RECIPE_IMAGE_CACHE_MAX_MB) and evicts least recently used files first.
+Callers get the bytes, not a path, so an eviction can't pull a file out from under a
+response; a derivative bigger than the whole cache is served without being stored.
+
+Pre-warm the common sizes at deploy time with:
+
+    python -m app.services.image_derivatives --sizes 320,640 --formats webp,jpeg
+"""
+import argparse
+import io
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from PIL import Image, features
+
+from app.services.recipe_catalog import IMAGES_DIR, image_index
+
+CACHE_DIR = Path(os.getenv("RECIPE_IMAGE_CACHE_DIR", Path(__file__).resolve().parent.parent.parent / ".image_cache"))
+CACHE_MAX_BYTES = int(float(os.getenv("RECIPE_IMAGE_CACHE_MAX_MB", "256")) * 1024 * 1024)
+
+# requested sizes are rounded up to one of these so the cache can't be filled with
+# one derivative per pixel value
+SIZE_STEPS = (64, 128, 160, 240, 320, 480, 640, 800, 960, 1280, 1600, 2048)
+
+FORMATS = {
+    # name: (Pillow format, media type, extension, save options)
+    "avif": ("AVIF", "image/avif", ".avif", {"quality": 60}),
+    "webp": ("WEBP", "image/webp", ".webp", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", "image/jpeg", ".jpg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+SUPPORTED_FORMATS = [name for name in ("avif", "webp") if features.check(name)] + ["jpeg"]
+
+
+def snap_size(value):
+    if value is None:
+        return None
+    for step in SIZE_STEPS:
+        if value <= step:
+            return step
+    return SIZE_STEPS[-1]
+
+
+def negotiate_format(accept_header):
+    """Best format the client accepts, falling back to jpeg."""
+    accept = (accept_header or "").lower()
+    for name in SUPPORTED_FORMATS:
+        if name != "jpeg" and FORMATS[name][1] in accept:
+            return name
+    return "jpeg"
+
+
+def media_type(fmt):
+    return FORMATS[fmt][1]
+
+
+class DerivativeCache:
+    def __init__(self, cache_dir: Path, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # filename -> size, oldest first
+        self._total = 0
+        self._lock = threading.Lock()
+        self._inflight = {}  # filename -> lock held while it is being generated
+        self._loaded = False
+        self.metrics = {"hits": 0, "misses": 0, "evictions": 0, "coalesced": 0}
+
+    def _load(self):
+        # pick up derivatives from a previous run, least recently used first
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        files = [p for p in self.cache_dir.iterdir() if p.is_file() and not p.name.endswith(".tmp")]
+        files.sort(key=lambda p: p.stat().st_mtime)
+        for p in files:
+            size = p.stat().st_size
+            self._entries[p.name] = size
+            self._total += size
+        self._loaded = True
+        self._evict_locked()
+
+    def _evict_locked(self):
+        while self._total > self.max_bytes and self._entries:
+            name, size = self._entries.popitem(last=False)
+            self._total -= size
+            self.metrics["evictions"] += 1
+            try:
+                (self.cache_dir / name).unlink()
+            except OSError:
+                pass
+
+    def _touch_locked(self, name):
+        self._entries.move_to_end(name)
+        try:
+            os.utime(self.cache_dir / name)
+        except OSError:
+            pass
+
+    def _add_locked(self, name, size):
+        self._entries[name] = size
+        self._total += size
+        self._evict_locked()
+
+    def _open_cached_locked(self, name):
+        """Open file of a cached derivative (readable even if evicted later), or None."""
+        if name not in self._entries:
+            return None
+        try:
+            f = open(self.cache_dir / name, "rb")
+        except OSError:
+            return None
+        self._touch_locked(name)
+        self.metrics["hits"] += 1
+        return f
+
+    def get_or_create(self, name, render):
+        """Bytes of the derivative `name`, calling render() -> bytes on a miss.
+
+        Concurrent requests for the same derivative wait for the first one instead of
+        rendering it again.
+        """
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            f = self._open_cached_locked(name)
+            if f is None:
+                gen_lock = self._inflight.get(name)
+                if gen_lock is None:
+                    gen_lock = threading.Lock()
+                    self._inflight[name] = gen_lock
+                else:
+                    self.metrics["coalesced"] += 1
+        if f is not None:
+            with f:
+                return f.read()
+
+        with gen_lock:
+            with self._lock:
+                f = self._open_cached_locked(name)
+                if f is None:
+                    self.metrics["misses"] += 1
+            if f is not None:
+                with f:
+                    return f.read()
+
+            try:
+                data = render()
+                if len(data) > self.max_bytes:
+                    return data
+                path = self.cache_dir / name
+                tmp = path.with_name(path.name + f".{threading.get_ident()}.tmp")
+                tmp.write_bytes(data)
+                os.replace(tmp, path)
+                with self._lock:
+                    self._entries.pop(name, None)
+                    # fits in max_bytes, so eviction stops before reaching this newest entry
+                    self._add_locked(name, len(data))
+            finally:
+                with self._lock:
+                    self._inflight.pop(name, None)
+            return data
+
+    def stats(self):
+        with self._lock:
+            return dict(self.metrics, files=len(self._entries), bytes=self._total, max_bytes=self.max_bytes)
+
+
+_cache = DerivativeCache(CACHE_DIR, CACHE_MAX_BYTES)
+
+
+def _render(source: Path, width, height, fmt) -> bytes:
+    pil_format, _, _, options = FORMATS[fmt]
+    box = (width or SIZE_STEPS[-1], height or SIZE_STEPS[-1])
+    with Image.open(source) as img:
+        # let the jpeg decoder downscale while decoding instead of after
+        img.draft("RGB", box)
+        img.thumbnail(box, Image.LANCZOS)
+        if fmt == "jpeg" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        elif img.mode == "P":
+            img = img.convert("RGBA")
+        out = io.BytesIO()
+        img.save(out, pil_format, **options)
+        return out.getvalue()
+
+
+def get_derivative(filename, width=None, height=None, fmt="jpeg"):
+    """(image bytes, content hash of the source) for `filename` scaled to fit width x height."""
+    source = IMAGES_DIR / filename
+    digest = image_index.content_hash(filename)
+    if digest is None:
+        return None, None
+    width, height = snap_size(width), snap_size(height)
+    name = f"{Path(filename).stem}-{digest}-{width or 0}x{height or 0}{FORMATS[fmt][2]}"
+    data = _cache.get_or_create(name, lambda: _render(source, width, height, fmt))
+    return data, digest
+
+
+def cache_stats():
+    return _cache.stats()
+
+
+def prewarm(sizes, formats):
+    image_index.refresh()
+    count = 0
+    for path in sorted(IMAGES_DIR.iterdir()):
+        if not path.is_file():
+            continue
+        for width in sizes:
+            for fmt in formats:
+                get_derivative(path.name, width, None, fmt)
+                count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-generate resized recipe images.")
+    parser.add_argument("--sizes", default="320,640", help="comma separated widths")
+    parser.add_argument("--formats", default=",".join(SUPPORTED_FORMATS), help="comma separated formats (avif, webp, jpeg)")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    formats = [f.strip() for f in args.formats.split(",") if f.strip()]
+    unknown = [f for f in formats if f not in SUPPORTED_FORMATS]
+    if unknown:
+        parser.error(f"unsupported formats: {', '.join(unknown)} (supported: {', '.join(SUPPORTED_FORMATS)})")
+
+    count = prewarm(sizes, formats)
+    print(f"Pre-warmed {count} derivatives into {CACHE_DIR}")
+    print(cache_stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""Where chat replies come from: Gemini, or an offline stub for benchmarks and load tests.
+
+LLM_BACKEND picks one at startup. A backend hands out models for a model name and
+system instruction; a model has the one method the chat routes and llm_client use,
+
+    await model.generate_content_async(prompt, stream=False)
+
+returning an object with .text, or with stream=True an async iterable of chunks with
+.text (the google.generativeai shape).
+
+The stub never touches the network. Replies are scripted by the last user message
+(asking to log food gets a LOG_MEAL block, photos get a vision reply, everything else
+one of a few canned answers), picked deterministically from a hash of the prompt.
+Latency comes from LLM_STUB_LATENCY_MS:
+
+    fixed:400               always 400 ms
+    uniform:200:900         uniformly between the two
+    lognormal:600:0.5       median 600 ms, sigma 0.5 (long right tail, like the real API)
+
+LLM_STUB_ERROR_RATE (0..1) makes that share of calls fail with a 503, to exercise
+retries and the circuit breaker.
+"""
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+
+BACKEND = os.getenv("LLM_BACKEND", "gemini").lower()
+STUB_LATENCY_MS = os.getenv("LLM_STUB_LATENCY_MS", "lognormal:600:0.5")
+STUB_ERROR_RATE = float(os.getenv("LLM_STUB_ERROR_RATE", "0"))
+STUB_SEED = int(os.getenv("LLM_STUB_SEED", "7"))
+STUB_CHUNK_WORDS = 4
+
+
+class LLMBackend:
+    name = "base"
+
+    @property
+    def configured(self):
+        return True
+
+    def model(self, model_name, system_instruction):
+        raise NotImplementedError
+
+
+class GeminiBackend(LLMBackend):
+    name = "gemini"
+
+    def __init__(self, api_key=None):
+        self.api_key = api_key or os.getenv("GEMINI_API_KEY")
+        if self.api_key:
+            genai.configure(api_key=self.api_key)
+
+    @property
+    def configured(self):
+        return bool(self.api_key)
+
+    def model(self, model_name, system_instruction):
+        return genai.GenerativeModel(model_name=model_name, system_instruction=system_instruction)
+
+
+def parse_latency(spec, rng):
+    """Callable returning one latency in seconds for a LLM_STUB_LATENCY_MS spec."""
+    kind, *args = spec.split(":")
+    args = [float(a) for a in args]
+    if kind == "fixed":
+        return lambda: args[0] / 1000
+    if kind == "uniform":
+        return lambda: rng.uniform(args[0], args[1]) / 1000
+    if kind == "lognormal":
+        median, sigma = args
+        return lambda: rng.lognormvariate(math.log(median), sigma) / 1000
+    raise ValueError(f"Unknown latency spec: {spec}")
+
+
+STUB_MEALS = [
+    {"name": "Greek Yogurt with Berries", "calories": 180, "protein": 15, "carbs": 22, "fats": 3, "meal_type": "Breakfast"},
+    {"name": "Turkey Sandwich", "calories": 420, "protein": 28, "carbs": 45, "fats": 12, "meal_type": "Lunch"},
+    {"name": "Grilled Chicken Salad", "calories": 350, "protein": 32, "carbs": 14, "fats": 17, "meal_type": "Lunch"},
+    {"name": "Salmon and Rice", "calories": 560, "protein": 36, "carbs": 52, "fats": 20, "meal_type": "Dinner"},
+    {"name": "Apple", "calories": 95, "protein": 0, "carbs": 25, "fats": 0, "meal_type": "Snack"},
+]
+
+STUB_ANSWERS = [
+    "Great question! Based on your goals, try adding a lean protein and a serving of vegetables to your next meal. "
+    "You still have room in today's calories, so a balanced dinner will keep you on track.",
+    "You're doing well today! Aim for a fiber-rich snack like fruit or nuts to stay full between meals. "
+    "Drinking water with each meal helps too.",
+    "For your dietary needs, a grain bowl with beans, greens and a simple dressing is quick and budget friendly. "
+    "It fits your calorie goal and uses basic kitchen equipment.",
+]
+
+STUB_VISION = (
+    "That looks like a plate of grilled chicken, brown rice and steamed broccoli. "
+    "I'd estimate about 520 calories, 42g protein, 50g carbs, 14g fat, 6g fiber and 480mg sodium. "
+    "Would you like me to log this meal, and is it Breakfast, Lunch or Dinner?"
+)
+
+LOG_REQUEST = re.compile(r"\b(log|logged|track|i (just )?(ate|had))\b", re.IGNORECASE)
+
+
+class _Reply:
+    def __init__(self, text):
+        self.text = text
+
+
+class _Stream:
+    def __init__(self, chunks, delays):
+        self._chunks = chunks
+        self._delays = delays
+
+    async def _iterate(self):
+        for chunk, delay in zip(self._chunks, self._delays):
+            await asyncio.sleep(delay)
+            yield _Reply(chunk)
+
+    def __aiter__(self):
+        return self._iterate()
+
+
+class StubModel:
+    def __init__(self, backend, model_name, system_instruction):
+        self.backend = backend
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+
+    def reply_for(self, prompt):
+        if isinstance(prompt, list):
+            return STUB_VISION
+        digest = int(hashlib.sha256(prompt.encode()).hexdigest(), 16)
+        if prompt.rstrip().endswith("Updated summary:"):
+            return "The user has been asking Chompy about meals that fit their calorie goal and logged a few foods."
+        message = prompt.rsplit("User:", 1)[-1]
+        if LOG_REQUEST.search(message):
+            meal = STUB_MEALS[digest % len(STUB_MEALS)]
+            return f"Done! I logged {meal['name']} as your {meal['meal_type'].lower()}.\nLOG_MEAL: {json.dumps(meal)}"
+        return STUB_ANSWERS[digest % len(STUB_ANSWERS)]
+
+    async def generate_content_async(self, prompt, stream=False):
+        latency = self.backend.latency()
+        self.backend.calls += 1
+        if self.backend.rng.random() < self.backend.error_rate:
+            await asyncio.sleep(latency / 4)
+            raise google_exceptions.ServiceUnavailable("stub backend: injected failure")
+        text = self.reply_for(prompt)
+        if not stream:
+            await asyncio.sleep(latency)
+            return _Reply(text)
+        words = text.split(" ")
+        chunks = [" ".join(words[i:i + STUB_CHUNK_WORDS]) + " " for i in range(0, len(words), STUB_CHUNK_WORDS)]
+        chunks[-1] = chunks[-1][:-1]
+        # roughly a third of the time before the first token, the rest spread over the chunks
+        rest = latency * 2 / 3 / max(len(chunks) - 1, 1)
+        return _Stream(chunks, [latency / 3] + [rest] * (len(chunks) - 1))
+
+
+class StubBackend(LLMBackend):
+    name = "stub"
+
+    def __init__(self, latency=STUB_LATENCY_MS, error_rate=STUB_ERROR_RATE, seed=STUB_SEED):
+        self.rng = random.Random(seed)
+        self.latency = parse_latency(latency, self.rng)
+        self.latency_spec = latency
+        self.error_rate = error_rate
+        self.calls = 0
+
+    def model(self, model_name, system_instruction):
+        return StubModel(self, model_name, system_instruction)
+
+
+BACKENDS = {"gemini": GeminiBackend, "stub": StubBackend}
+
+
+def get_backend(name=BACKEND):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown LLM_BACKEND {name!r}, expected one of {sorted(BACKENDS)}")
+    backend = BACKENDS[name]()
+    print(f"LLM backend: {backend.name}")
+    return backend
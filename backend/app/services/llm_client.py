@@ -0,0 +1,316 @@
+"""One client for every Gemini call the chat routes make.
+
+- at most LLM_MAX_CONCURRENCY calls in flight per worker; the rest wait in line, and
+  give up with LLMBusy if no slot frees up before their deadline
+- every call has a deadline (LLM_DEADLINE_SECONDS) covering the wait, the retries and
+  the call itself; each attempt is also capped at LLM_ATTEMPT_TIMEOUT_SECONDS
+- rate limits, 5xx and attempt timeouts are retried with jittered exponential backoff
+- after LLM_BREAKER_FAILURES upstream failures in a row the breaker opens and calls
+  fail fast with LLMUnavailable for LLM_BREAKER_COOLDOWN_SECONDS, then one probe call
+  is let through to decide whether to close it again
+- calls made with the same key while one is already running wait for its result
+  instead of sending the prompt again
+"""
+import asyncio
+import os
+import random
+import time
+from collections import deque
+
+from google.api_core import exceptions as google_exceptions
+
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "30"))
+ATTEMPT_TIMEOUT_SECONDS = float(os.getenv("LLM_ATTEMPT_TIMEOUT_SECONDS", "20"))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 4.0
+BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN_SECONDS = float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", "30"))
+LATENCY_SAMPLES = 1000
+
+# upstream trouble worth another try; bad requests and safety blocks are not
+RETRYABLE_ERRORS = (
+    google_exceptions.TooManyRequests,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+    asyncio.TimeoutError,
+    ConnectionError,
+)
+
+
+class LLMError(Exception):
+    code = "error"
+
+
+class LLMBusy(LLMError):
+    code = "busy"
+
+
+class LLMTimeout(LLMError):
+    code = "timeout"
+
+
+class LLMUnavailable(LLMError):
+    code = "unavailable"
+
+
+def _percentiles(samples):
+    if not samples:
+        return {"p50": None, "p95": None, "p99": None}
+    ordered = sorted(samples)
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 1)
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99)}
+
+
+class CircuitBreaker:
+    def __init__(self, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN_SECONDS):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def allow(self):
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+            self.state = "half_open"
+        if self.state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def success(self):
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._probing = False
+
+    def abandon(self):
+        # a probe that was cancelled or never got a slot says nothing about the upstream
+        self._probing = False
+
+    def failure(self):
+        self.consecutive_failures += 1
+        self._probing = False
+        if self.state == "half_open" or self.consecutive_failures >= self.failures:
+            if self.state != "open":
+                print(f"LLM circuit breaker open after {self.consecutive_failures} failures")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+
+class LLMClient:
+    def __init__(self, max_concurrency=MAX_CONCURRENCY, deadline=DEADLINE_SECONDS,
+                 attempt_timeout=ATTEMPT_TIMEOUT_SECONDS, max_retries=MAX_RETRIES,
+                 retryable=RETRYABLE_ERRORS, breaker=None):
+        self.max_concurrency = max_concurrency
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.max_retries = max_retries
+        self.retryable = retryable
+        self.breaker = breaker or CircuitBreaker()
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._inflight = {}  # key -> future with the text of the call already running
+        self.in_flight = 0
+        self.queued = 0
+        self.peak_queued = 0
+        self._latency = deque(maxlen=LATENCY_SAMPLES)
+        self._queue_wait = deque(maxlen=LATENCY_SAMPLES)
+        self.metrics = {
+            "calls": 0, "succeeded": 0, "failed": 0, "retries": 0, "timeouts": 0,
+            "busy": 0, "coalesced": 0, "rejected_open": 0,
+        }
+
+    def _remaining(self, deadline_at):
+        return deadline_at - time.monotonic()
+
+    async def _acquire(self, deadline_at):
+        self.queued += 1
+        self.peak_queued = max(self.peak_queued, self.queued)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), max(self._remaining(deadline_at), 0))
+        except asyncio.TimeoutError:
+            self.metrics["busy"] += 1
+            self.breaker.abandon()
+            raise LLMBusy("No free model slot before the deadline")
+        finally:
+            self.queued -= 1
+        self._queue_wait.append((time.perf_counter() - start) * 1000)
+        self.in_flight += 1
+
+    def _release(self):
+        self.in_flight -= 1
+        self._slots.release()
+
+    def _check_breaker(self):
+        if not self.breaker.allow():
+            self.metrics["rejected_open"] += 1
+            raise LLMUnavailable("Model upstream is failing, try again shortly")
+
+    async def _backoff(self, attempt, deadline_at):
+        """Sleep before retry number `attempt`; False if the deadline leaves no room for it."""
+        delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+        if delay >= self._remaining(deadline_at):
+            return False
+        self.metrics["retries"] += 1
+        await asyncio.sleep(delay)
+        return True
+
+    def _failed(self, e):
+        self.metrics["failed"] += 1
+        if isinstance(e, self.retryable):
+            self.breaker.failure()
+        else:
+            # the upstream answered, just not with something usable
+            self.breaker.success()
+        if isinstance(e, asyncio.TimeoutError):
+            self.metrics["timeouts"] += 1
+            return LLMTimeout("Model call ran past its deadline")
+        return e
+
+    async def _call(self, model, prompt, deadline_at):
+        self._check_breaker()
+        await self._acquire(deadline_at)
+        start = time.perf_counter()
+        try:
+            attempt = 0
+            while True:
+                timeout = min(self.attempt_timeout, self._remaining(deadline_at))
+                try:
+                    if timeout <= 0:
+                        raise asyncio.TimeoutError()
+                    response = await asyncio.wait_for(model.generate_content_async(prompt), timeout)
+                    text = response.text
+                    break
+                except self.retryable:
+                    if attempt >= self.max_retries or not await self._backoff(attempt, deadline_at):
+                        raise
+                    attempt += 1
+        except Exception as e:
+            raise self._failed(e)
+        finally:
+            self._release()
+        self.breaker.success()
+        self.metrics["succeeded"] += 1
+        self._latency.append((time.perf_counter() - start) * 1000)
+        return text
+
+    async def _follow(self, future, deadline_at):
+        self.metrics["coalesced"] += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), max(self._remaining(deadline_at), 0))
+        except asyncio.TimeoutError:
+            raise LLMTimeout("Model call ran past its deadline")
+
+    def _lead(self, key):
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        return future
+
+    def _settle(self, key, future, text=None, error=None):
+        self._inflight.pop(key, None)
+        if future.done():
+            return
+        if error is None:
+            future.set_result(text)
+        else:
+            future.set_exception(error)
+            future.exception()  # followers are optional; don't warn when there are none
+
+    async def generate(self, model, prompt, key=None, deadline=None):
+        """Reply text for `prompt` from `model`, raising LLMError subclasses on failure."""
+        self.metrics["calls"] += 1
+        deadline_at = time.monotonic() + (deadline or self.deadline)
+        if key is not None and key in self._inflight:
+            return await self._follow(self._inflight[key], deadline_at)
+        future = self._lead(key) if key is not None else None
+        try:
+            text = await self._call(model, prompt, deadline_at)
+        except BaseException as e:
+            if not isinstance(e, Exception):
+                self.breaker.abandon()
+            if future is not None:
+                self._settle(key, future, error=e if isinstance(e, Exception) else LLMError("Call cancelled"))
+            raise
+        if future is not None:
+            self._settle(key, future, text)
+        return text
+
+    async def stream(self, model, prompt, key=None, deadline=None):
+        """Async iterator of reply text chunks.
+
+        Retries only happen before the first chunk; once text has gone out an error is
+        raised to the caller. A coalesced caller gets the leader's whole reply as one chunk.
+        """
+        self.metrics["calls"] += 1
+        deadline_at = time.monotonic() + (deadline or self.deadline)
+        if key is not None and key in self._inflight:
+            yield await self._follow(self._inflight[key], deadline_at)
+            return
+        future = self._lead(key) if key is not None else None
+        text = ""
+        try:
+            self._check_breaker()
+            await self._acquire(deadline_at)
+            start = time.perf_counter()
+            try:
+                attempt = 0
+                while True:
+                    try:
+                        timeout = min(self.attempt_timeout, self._remaining(deadline_at))
+                        if timeout <= 0:
+                            raise asyncio.TimeoutError()
+                        response = await asyncio.wait_for(model.generate_content_async(prompt, stream=True), timeout)
+                        chunks = response.__aiter__()
+                        first = await asyncio.wait_for(chunks.__anext__(), max(self._remaining(deadline_at), 0))
+                        break
+                    except StopAsyncIteration:
+                        first = None
+                        break
+                    except self.retryable:
+                        if attempt >= self.max_retries or not await self._backoff(attempt, deadline_at):
+                            raise
+                        attempt += 1
+                while first is not None:
+                    text += first.text
+                    yield first.text
+                    try:
+                        first = await asyncio.wait_for(chunks.__anext__(), max(self._remaining(deadline_at), 0))
+                    except StopAsyncIteration:
+                        first = None
+            except Exception as e:
+                raise self._failed(e)
+            finally:
+                self._release()
+            self.breaker.success()
+            self.metrics["succeeded"] += 1
+            self._latency.append((time.perf_counter() - start) * 1000)
+        except BaseException as e:
+            if not isinstance(e, Exception):
+                self.breaker.abandon()
+            if future is not None:
+                self._settle(key, future, error=e if isinstance(e, Exception) else LLMError("Call cancelled"))
+            raise
+        if future is not None:
+            self._settle(key, future, text)
+
+    def stats(self):
+        breaker = self.breaker
+        return {
+            **self.metrics,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "peak_queued": self.peak_queued,
+            "max_concurrency": self.max_concurrency,
+            "breaker": {"state": breaker.state, "consecutive_failures": breaker.consecutive_failures},
+            "latency_ms": _percentiles(self._latency),
+            "queue_wait_ms": _percentiles(self._queue_wait),
+        }
+
+
+llm_client = LLMClient()
@@ -0,0 +1,62 @@
+"""Calendar days in the user's timezone, as UTC timestamp ranges.
+
+Meal lookups filter on created_at >= start AND created_at < end instead of
+func.date(created_at) == day, so the (user_email, created_at) index on meals can be
+used. created_at is stored in UTC.
+"""
+import os
+from datetime import datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from app.models.meals import Meal
+
+DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE", "UTC")
+
+
+def resolve_timezone(name=None):
+    """ZoneInfo for an IANA name like "America/New_York", DEFAULT_TIMEZONE if unset or unknown."""
+    for candidate in (name, DEFAULT_TIMEZONE):
+        if not candidate:
+            continue
+        try:
+            return ZoneInfo(candidate)
+        except (ZoneInfoNotFoundError, ValueError):
+            print(f"Unknown timezone {candidate!r}, falling back")
+    return timezone.utc
+
+
+def local_today(tz):
+    return datetime.now(tz).date()
+
+
+def local_date(moment, tz):
+    """Calendar date of a stored created_at in tz (naive values are UTC)."""
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(tz).date()
+
+
+def day_bounds(day, tz):
+    """[start, end) of the local calendar day in UTC."""
+    start = datetime.combine(day, time.min, tzinfo=tz)
+    end = datetime.combine(day + timedelta(days=1), time.min, tzinfo=tz)
+    return start.astimezone(timezone.utc), end.astimezone(timezone.utc)
+
+
+def range_bounds(first_day, last_day, tz):
+    """UTC [start, end) covering local days first_day..last_day inclusive; None for an open end."""
+    start = day_bounds(first_day, tz)[0] if first_day else None
+    end = day_bounds(last_day, tz)[1] if last_day else None
+    return start, end
+
+
+def meals_on_day(db, user_email, tz_name=None, day=None):
+    """The user's meals logged on `day` (default today) in their timezone, oldest first."""
+    tz = resolve_timezone(tz_name)
+    start, end = day_bounds(day or local_today(tz), tz)
+    return (
+        db.query(Meal)
+        .filter(Meal.user_email == user_email, Meal.created_at >= start, Meal.created_at < end)
+        .order_by(Meal.created_at)
+        .all()
+    )
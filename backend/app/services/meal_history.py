@@ -0,0 +1,101 @@
+"""Per-user meal history: keyset pages for the UI and streamed exports.
+
+Pages are ordered newest first on (created_at, id) and continue from an opaque cursor
+holding the last row's key, so page 500 costs the same index seek as page 1.
+"""
+import base64
+import csv
+import io
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, or_, select
+
+from app.models.meals import Meal
+from app.services.meal_days import range_bounds, resolve_timezone
+
+MEAL_FIELDS = ("id", "user_email", "meal_type", "food_name", "calories", "protein",
+               "carbs", "fats", "fiber", "sodium", "created_at")
+EXPORT_BATCH = 500
+
+
+def encode_cursor(created_at, meal_id):
+    raw = f"{created_at.isoformat()}|{meal_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """(created_at, id) or raises ValueError."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, meal_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(meal_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def history_query(user_email, first_day=None, last_day=None, tz_name=None):
+    """select() of the user's meals between two local dates (inclusive), newest first."""
+    start, end = range_bounds(first_day, last_day, resolve_timezone(tz_name))
+    stmt = select(*[getattr(Meal, f) for f in MEAL_FIELDS]).where(Meal.user_email == user_email)
+    if start is not None:
+        stmt = stmt.where(Meal.created_at >= start)
+    if end is not None:
+        stmt = stmt.where(Meal.created_at < end)
+    return stmt.order_by(Meal.created_at.desc(), Meal.id.desc())
+
+
+def _row_dict(row):
+    out = dict(row._mapping)
+    if out["created_at"] is not None:
+        out["created_at"] = out["created_at"].isoformat()
+    return out
+
+
+def history_page(db, stmt, cursor=None, limit=50):
+    """(meals, next cursor or None)."""
+    if cursor:
+        created_at, meal_id = decode_cursor(cursor)
+        stmt = stmt.where(or_(
+            Meal.created_at < created_at,
+            and_(Meal.created_at == created_at, Meal.id < meal_id),
+        ))
+    # one extra row tells us whether there is a next page
+    rows = db.execute(stmt.limit(limit + 1)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        if last.created_at is not None:
+            next_cursor = encode_cursor(last.created_at, last.id)
+    return [_row_dict(r) for r in rows], next_cursor
+
+
+def _stream_rows(session_factory, stmt):
+    # own session: the request's session may be closed before the body is sent
+    db = session_factory()
+    try:
+        result = db.execute(stmt.execution_options(stream_results=True, yield_per=EXPORT_BATCH))
+        for rows in result.partitions():
+            yield rows
+    finally:
+        db.close()
+
+
+def export_ndjson(session_factory, stmt):
+    for rows in _stream_rows(session_factory, stmt):
+        yield "".join(json.dumps(_row_dict(r)) + "\n" for r in rows)
+
+
+def export_csv(session_factory, stmt):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(MEAL_FIELDS)
+    for rows in _stream_rows(session_factory, stmt):
+        for r in rows:
+            writer.writerow(_row_dict(r)[f] for f in MEAL_FIELDS)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
@@ -0,0 +1,184 @@
+"""Background writer for meals the chat logs on the user's behalf.
+
+A reply with a LOG_MEAL block is returned as soon as the model is done; the meal goes
+on this queue with a pending-log id the client can check at GET /chat/log/{id}. One
+worker task drains the queue and writes whatever has piled up (up to
+CHAT_LOG_BATCH_SIZE, waiting at most CHAT_LOG_BATCH_WAIT_MS for more) in a single
+transaction. If that transaction fails each meal is retried on its own, so one bad
+row only fails its own log.
+
+Statuses are kept in memory for CHAT_LOG_STATUS_TTL seconds, per process: behind
+several workers, ask the worker that took the chat request, or check /meals/today.
+"""
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict
+
+from app.database import AsyncSessionLocal
+from app.models.meals import Meal
+from app.services import context_cache, daily_totals
+from app.services.meal_days import local_today, resolve_timezone
+
+BATCH_SIZE = int(os.getenv("CHAT_LOG_BATCH_SIZE", "50"))
+BATCH_WAIT_SECONDS = float(os.getenv("CHAT_LOG_BATCH_WAIT_MS", "20")) / 1000
+STATUS_TTL_SECONDS = float(os.getenv("CHAT_LOG_STATUS_TTL", "3600"))
+MAX_STATUSES = 10000
+
+
+def log_chat_meal(db, user_email, meal_data, tz=None):
+    new_meal = Meal(
+        user_email=user_email,
+        food_name=meal_data.get("name", "Unknown Food"),
+        calories=meal_data.get("calories", 0),
+        protein=meal_data.get("protein", 0),
+        carbs=meal_data.get("carbs", 0),
+        fats=meal_data.get("fats", 0),
+        sodium=meal_data.get("sodium", 0),
+        fiber=meal_data.get("fiber", 0),
+        meal_type=meal_data.get("meal_type", "Snack"),
+    )
+    db.add(new_meal)
+    daily_totals.add_meal(db, new_meal, local_today(resolve_timezone(tz)))
+    return new_meal
+
+
+def _write(db, jobs):
+    # sync, through AsyncSession.run_sync; one flush for the whole batch
+    meals = [log_chat_meal(db, job["user_email"], job["meal_data"], job["tz"]) for job in jobs]
+    db.flush()
+    return [m.id for m in meals]
+
+
+class MealLogQueue:
+    def __init__(self, batch_size=BATCH_SIZE, batch_wait=BATCH_WAIT_SECONDS):
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self._queue = None
+        self._task = None
+        self._statuses = OrderedDict()  # pending id -> status dict, oldest first
+        self.metrics = {"submitted": 0, "logged": 0, "failed": 0, "batches": 0, "write_ms": 0.0}
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._task.get_loop() is loop:
+            return
+        self._queue = asyncio.Queue()
+        self._task = loop.create_task(self._run())
+
+    async def stop(self):
+        """Write what is queued, then stop the worker."""
+        if self._task is None or self._task.done():
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    def submit(self, user_email, meal_data, tz=None):
+        """Queue a meal and return its pending-log id."""
+        self.start()
+        pending_id = uuid.uuid4().hex
+        self._remember(pending_id, {
+            "status": "pending", "user_email": user_email,
+            "food_name": meal_data.get("name", "Unknown Food"), "meal_id": None,
+        })
+        self._queue.put_nowait({"id": pending_id, "user_email": user_email, "meal_data": meal_data, "tz": tz})
+        self.metrics["submitted"] += 1
+        return pending_id
+
+    def status(self, pending_id):
+        entry = self._statuses.get(pending_id)
+        if entry is None or entry["expires"] < time.monotonic():
+            return None
+        return {k: v for k, v in entry.items() if k != "expires"}
+
+    def _remember(self, pending_id, status):
+        self._statuses[pending_id] = {**status, "expires": time.monotonic() + STATUS_TTL_SECONDS}
+        self._statuses.move_to_end(pending_id)
+        while len(self._statuses) > MAX_STATUSES:
+            self._statuses.popitem(last=False)
+        # drop expired entries from the old end
+        while self._statuses:
+            oldest = next(iter(self._statuses.values()))
+            if oldest["expires"] >= time.monotonic():
+                break
+            self._statuses.popitem(last=False)
+
+    def _settle(self, job, meal_id=None, error=None):
+        entry = self._statuses.get(job["id"])
+        if entry is None:
+            return
+        if error is None:
+            entry.update(status="logged", meal_id=meal_id)
+            self.metrics["logged"] += 1
+        else:
+            entry.update(status="failed", error=str(error))
+            self.metrics["failed"] += 1
+
+    async def _next_batch(self):
+        jobs = [await self._queue.get()]
+        deadline = time.monotonic() + self.batch_wait
+        while len(jobs) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                jobs.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return jobs
+
+    async def _write_batch(self, jobs):
+        start = time.perf_counter()
+        async with AsyncSessionLocal() as db:
+            try:
+                ids = await db.run_sync(_write, jobs)
+                await db.commit()
+                for job, meal_id in zip(jobs, ids):
+                    self._settle(job, meal_id)
+            except Exception as e:
+                await db.rollback()
+                if len(jobs) == 1:
+                    print(f"Auto-Log Error: {e}")
+                    self._settle(jobs[0], error=e)
+                else:
+                    for job in jobs:
+                        await self._write_batch([job])
+                    return
+        self.metrics["batches"] += 1
+        self.metrics["write_ms"] += (time.perf_counter() - start) * 1000
+        for user_email in {job["user_email"] for job in jobs}:
+            context_cache.invalidate(user_email)
+        if len(jobs) == 1 and self._statuses.get(jobs[0]["id"], {}).get("status") == "logged":
+            print(f"AUTO-LOGGED: {jobs[0]['meal_data'].get('name')}")
+        elif len(jobs) > 1:
+            print(f"AUTO-LOGGED: {len(jobs)} meals in one batch")
+
+    async def _run(self):
+        while True:
+            jobs = await self._next_batch()
+            try:
+                await self._write_batch(jobs)
+            except Exception as e:
+                print(f"Auto-Log Error: {e}")
+                for job in jobs:
+                    self._settle(job, error=e)
+            finally:
+                for _ in jobs:
+                    self._queue.task_done()
+
+    def stats(self):
+        batches = self.metrics["batches"]
+        return dict(
+            self.metrics,
+            write_ms=round(self.metrics["write_ms"], 1),
+            queued=self._queue.qsize() if self._queue is not None else 0,
+            avg_batch=round((self.metrics["logged"] + self.metrics["failed"]) / batches, 2) if batches else None,
+        )
+
+
+meal_log_queue = MealLogQueue()
@@ -0,0 +1,212 @@
+"""Weekly meal plans built from the recipe catalog.
+
+Each day gets one Breakfast, Lunch, Dinner and Dessert recipe. A day is solved with
+coordinate descent over the four slots (swap one slot for the candidate that brings
+the day's calories/protein/carbs/fat closest to the goals, repeat until nothing
+improves) from a few random starts, inside a hard time budget. A slot can be 1, 1.5
+or 2 servings of a recipe. Recipes are capped at max_repeats uses per week and are not
+served two days in a row when there is anything else to pick.
+
+Generate plans for every profile in the database (or one, with --user-email), in
+parallel. Only plan JSON lines go to stdout; progress goes to stderr:
+
+    python -m app.services.meal_plan --all-users --workers 4 --out plans.jsonl
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from app.services.recipe_recommend import MACRO_KEYS, MACRO_WEIGHTS
+
+MEAL_SLOTS = ("Breakfast", "Lunch", "Dinner", "Dessert")
+DAYS = 7
+DEFAULT_TOLERANCE = 0.10
+DEFAULT_MAX_REPEATS = 2
+TIME_BUDGET_MS = float(os.getenv("PLAN_TIME_BUDGET_MS", "200"))
+MAX_PASSES = 10
+MAX_RESTARTS = 8
+PORTIONS = (1.0, 1.5, 2.0)
+
+
+def _day_score(total, goals):
+    diff = (total - goals) / np.maximum(goals, 1.0)
+    return float(((diff ** 2) * MACRO_WEIGHTS).sum())
+
+
+def plan_week(catalog, goals, mask=0, days=DAYS, tolerance=DEFAULT_TOLERANCE,
+              max_repeats=DEFAULT_MAX_REPEATS, time_budget_ms=TIME_BUDGET_MS, seed=0):
+    """{"days": [...], "timed_out": bool}; each day's meals map slot -> (catalog row, servings)."""
+    deadline = time.perf_counter() + time_budget_ms / 1000
+    rng = np.random.default_rng(seed)
+    matrix = catalog.macro_matrix
+    allowed = matrix.complete & ((matrix.masks & mask) == mask)
+
+    # per slot: every (recipe row, portion) candidate and its macro vector
+    slots = []
+    for slot in MEAL_SLOTS:
+        codes = [i for i, c in enumerate(catalog.categories) if c == slot]
+        rows = np.flatnonzero(allowed & np.isin(catalog.category_codes, codes))
+        if rows.size:
+            rows = np.repeat(rows, len(PORTIONS))
+            portions = np.tile(PORTIONS, rows.size // len(PORTIONS))
+            slots.append((slot, rows, portions, matrix.values[rows] * portions[:, None]))
+
+    uses = {}
+    yesterday = set()
+    timed_out = False
+    out_days = []
+    for day in range(days):
+        # per slot: candidates under the repeat cap and not eaten yesterday, relaxing
+        # those rules when they leave nothing
+        open_idx = []
+        for _, rows, _, _ in slots:
+            under_cap = np.array([uses.get(r, 0) < max_repeats for r in rows.tolist()], dtype=bool)
+            fresh = under_cap & ~np.isin(rows, list(yesterday))
+            for ok in (fresh, under_cap):
+                if ok.any():
+                    open_idx.append(np.flatnonzero(ok))
+                    break
+            else:
+                open_idx.append(np.arange(rows.size))
+
+        best, best_score = None, None
+        for restart in range(MAX_RESTARTS):
+            if restart and time.perf_counter() > deadline:
+                timed_out = True
+                break
+            picks = [int(rng.choice(idx)) for idx in open_idx]
+            total = sum(values[p] for (_, _, _, values), p in zip(slots, picks)) if slots else np.zeros(len(MACRO_KEYS))
+            for _ in range(MAX_PASSES):
+                changed = False
+                for s, (_, _, _, values) in enumerate(slots):
+                    rest = total - values[picks[s]]
+                    cand = values[open_idx[s]] + rest
+                    diff = (cand - goals) / np.maximum(goals, 1.0)
+                    scores = ((diff ** 2) * MACRO_WEIGHTS).sum(axis=1)
+                    choice = int(open_idx[s][int(np.argmin(scores))])
+                    if choice != picks[s]:
+                        picks[s] = choice
+                        total = rest + values[choice]
+                        changed = True
+                if not changed or time.perf_counter() > deadline:
+                    break
+            score = _day_score(total, goals)
+            if best_score is None or score < best_score:
+                best, best_score = (list(picks), total.copy()), score
+
+        if best is None:
+            out_days.append({"day": day + 1, "meals": {}, "totals": None, "within_tolerance": False})
+            continue
+        picks, total = best
+        meals = {}
+        yesterday = set()
+        for (slot, rows, portions, _), p in zip(slots, picks):
+            row = int(rows[p])
+            meals[slot] = (row, float(portions[p]))
+            uses[row] = uses.get(row, 0) + 1
+            yesterday.add(row)
+        rel = np.abs(total - goals) / np.maximum(goals, 1.0)
+        out_days.append({
+            "day": day + 1,
+            "meals": meals,
+            "totals": dict(zip(MACRO_KEYS, [round(v, 1) for v in total.tolist()])),
+            "within_tolerance": bool((rel <= tolerance).all()),
+        })
+    return {"days": out_days, "timed_out": timed_out}
+
+
+def user_seed(user_email):
+    # same user gets the same plan for the same catalog unless a seed is given
+    return zlib.crc32((user_email or "").encode())
+
+
+# batch generation, one worker process per core
+
+_worker_catalog = None
+
+
+def _init_worker():
+    global _worker_catalog
+    from app.services.recipe_catalog import get_catalog
+
+    # the catalog build line would land between the json lines on stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        _worker_catalog = get_catalog()
+
+
+def _plan_job(job):
+    user_email, goals, mask = job
+    start = time.perf_counter()
+    plan = plan_week(_worker_catalog, np.array(goals), mask, seed=user_seed(user_email))
+    days = []
+    for d in plan["days"]:
+        d = dict(d)
+        d["meals"] = {
+            slot: {"slug": _worker_catalog.recipes[row].slug, "servings": servings}
+            for slot, (row, servings) in d["meals"].items()
+        }
+        days.append(d)
+    return {
+        "user_email": user_email,
+        "days": days,
+        "timed_out": plan["timed_out"],
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
+
+
+def _load_jobs(user_email=None):
+    from app.database import SessionLocal
+    from app.models.profile import Profile
+    from app.services.diet_flags import mask_from_restrictions
+    from app.services.recipe_recommend import macro_goals
+
+    db = SessionLocal()
+    try:
+        jobs = []
+        profiles = db.query(Profile)
+        if user_email:
+            profiles = profiles.filter(Profile.user_email == user_email)
+        for profile in profiles.all():
+            dr = profile.dietary_restrictions if isinstance(profile.dietary_restrictions, list) else []
+            jobs.append((profile.user_email, macro_goals(profile).tolist(), mask_from_restrictions(dr)))
+        return jobs
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate weekly meal plans for every profile.")
+    who = parser.add_mutually_exclusive_group(required=True)
+    who.add_argument("--all-users", action="store_true", help="every profile in the database")
+    who.add_argument("--user-email", help="only this user's profile")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--out", default="-", help="json lines output file, - for stdout")
+    args = parser.parse_args()
+
+    jobs = _load_jobs(args.user_email)
+    start = time.perf_counter()
+    out = open(args.out, "w") if args.out != "-" else None
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker) as pool:
+            for result in pool.map(_plan_job, jobs, chunksize=max(1, len(jobs) // (args.workers * 4))):
+                line = json.dumps(result)
+                if out:
+                    out.write(line + "\n")
+                else:
+                    print(line)
+    finally:
+        if out:
+            out.close()
+    elapsed = time.perf_counter() - start
+    print(f"Planned {len(jobs)} users in {elapsed:.1f} s with {args.workers} workers", file=sys.stderr, flush=True)
+
+
+if __name__ == "__main__":
+    main()
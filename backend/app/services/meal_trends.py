@@ -0,0 +1,103 @@
+"""Nutrition trends over the daily_totals rollup.
+
+Buckets (day / week / month) and the 7/30/90-day rolling averages are GROUP BY
+queries on daily_totals, one row per logged day, so a year of history is at most
+365 rows read and never the meals themselves. Averages are per logged day; days
+with nothing logged are left out rather than counted as zero.
+"""
+import math
+from datetime import timedelta
+
+from sqlalchemy import case, cast, func, select, Date
+
+from app.models.daily_totals import DailyTotal
+from app.services.daily_totals import NUTRIENTS
+
+BUCKETS = ("day", "week", "month")
+ROLLING_WINDOWS = (7, 30, 90)
+DEFAULT_POINTS = 60
+# days per bucket, used to pick one that fits in the requested number of points
+_BUCKET_DAYS = {"day": 1, "week": 7, "month": 30.4}
+
+
+def pick_bucket(start, end, points):
+    days = (end - start).days + 1
+    for bucket in BUCKETS:
+        if days / _BUCKET_DAYS[bucket] <= points:
+            return bucket
+    return "month"
+
+
+def _bucket_start(bucket, dialect):
+    """SQL expression for the first day of the bucket holding DailyTotal.day."""
+    day = DailyTotal.day
+    if bucket == "day":
+        return day
+    if dialect == "sqlite":
+        if bucket == "week":
+            # back up 6 days then forward to the next monday = monday on or before day
+            return func.date(day, "-6 days", "weekday 1")
+        return func.strftime("%Y-%m-01", day)
+    return cast(func.date_trunc(bucket, day), Date)
+
+
+def _averages(row, count):
+    return {k: round(getattr(row, k) / count, 1) if count else None for k in NUTRIENTS}
+
+
+def bucket_series(db, user_email, start, end, bucket):
+    """[{start, days_logged, calories, ...}] averaged per logged day in each bucket."""
+    key = _bucket_start(bucket, db.get_bind().dialect.name).label("bucket")
+    stmt = (
+        select(key, func.count().label("days_logged"),
+               *[func.sum(getattr(DailyTotal, k)).label(k) for k in NUTRIENTS])
+        .where(DailyTotal.user_email == user_email, DailyTotal.day >= start, DailyTotal.day <= end,
+               DailyTotal.meal_count > 0)
+        .group_by(key)
+        .order_by(key)
+    )
+    series = []
+    for row in db.execute(stmt):
+        series.append({"start": str(row.bucket), "days_logged": row.days_logged, **_averages(row, row.days_logged)})
+    return series
+
+
+def rolling_averages(db, user_email, end, windows=ROLLING_WINDOWS):
+    """{window: {days_logged, calories, ...}} for the windows ending on `end`, in one query."""
+    columns = []
+    for w in windows:
+        since = end - timedelta(days=w - 1)
+        in_window = DailyTotal.day >= since
+        columns.append(func.count(case((in_window, 1))).label(f"n{w}"))
+        columns += [func.sum(case((in_window, getattr(DailyTotal, k)))).label(f"{k}{w}") for k in NUTRIENTS]
+    stmt = select(*columns).where(
+        DailyTotal.user_email == user_email,
+        DailyTotal.day >= end - timedelta(days=max(windows) - 1),
+        DailyTotal.day <= end,
+        DailyTotal.meal_count > 0,  # rows left behind when a day's meals were deleted
+    )
+    row = db.execute(stmt).one()
+    out = {}
+    for w in windows:
+        count = getattr(row, f"n{w}")
+        out[str(w)] = {"days_logged": count}
+        for k in NUTRIENTS:
+            total = getattr(row, f"{k}{w}")
+            out[str(w)][k] = round(total / count, 1) if count and total is not None else None
+    return out
+
+
+def downsample(series, points):
+    """Merge neighbouring buckets so there are at most `points`, weighted by days logged."""
+    if len(series) <= points:
+        return series
+    step = math.ceil(len(series) / points)
+    out = []
+    for i in range(0, len(series), step):
+        chunk = series[i:i + step]
+        days = sum(p["days_logged"] for p in chunk)
+        merged = {"start": chunk[0]["start"], "days_logged": days}
+        for k in NUTRIENTS:
+            merged[k] = round(sum((p[k] or 0) * p["days_logged"] for p in chunk) / days, 1) if days else None
+        out.append(merged)
+    return out
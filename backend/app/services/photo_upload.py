@@ -0,0 +1,60 @@
+"""Meal photos for the vision model: size limits and server-side downscaling.
+
+Uploads are read in chunks with a byte cap (Starlette spools anything past 1 MB to a
+temp file), then decoded straight to at most CHAT_UPLOAD_MAX_SIDE pixels on the long
+edge and re-encoded as JPEG. For JPEG sources draft() makes the decoder scale down
+while decoding, so a 12 MP phone photo never exists in memory at full size; other
+formats are decoded in full, which CHAT_UPLOAD_MAX_PIXELS bounds.
+"""
+import io
+import os
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+MAX_UPLOAD_BYTES = int(float(os.getenv("CHAT_UPLOAD_MAX_MB", "15")) * 1024 * 1024)
+MAX_SIDE = int(os.getenv("CHAT_UPLOAD_MAX_SIDE", "1024"))
+MAX_PIXELS = int(os.getenv("CHAT_UPLOAD_MAX_PIXELS", "40000000"))
+JPEG_QUALITY = 85
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+def limit_receive(receive, max_bytes=MAX_UPLOAD_BYTES):
+    """Wrap an ASGI receive so the body is cut off once it passes max_bytes."""
+    received = 0
+
+    async def limited():
+        nonlocal received
+        message = await receive()
+        if message["type"] == "http.request":
+            received += len(message.get("body", b""))
+            if received > max_bytes:
+                raise UploadTooLarge(f"Photo is larger than {max_bytes / (1024 * 1024):g} MB")
+        return message
+
+    return limited
+
+
+def prepare_image(fileobj, max_side=MAX_SIDE):
+    """JPEG bytes of the photo in `fileobj`, at most max_side px on the long edge.
+
+    Raises ValueError for anything Pillow can't read or that is too many pixels.
+    """
+    try:
+        with Image.open(fileobj) as img:
+            if img.width * img.height > MAX_PIXELS:
+                raise UploadTooLarge(f"Photo is larger than {MAX_PIXELS / 1_000_000:g} megapixels")
+            box = (max_side, max_side)
+            img.draft("RGB", box)
+            img.thumbnail(box, Image.LANCZOS)
+            # phones store rotation in EXIF, which the re-encode below drops
+            img = ImageOps.exif_transpose(img)
+            if img.mode != "RGB":
+                img = img.convert("RGB")
+            out = io.BytesIO()
+            img.save(out, "JPEG", quality=JPEG_QUALITY, optimize=True)
+            return out.getvalue()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        raise ValueError(f"Could not read image: {e}")
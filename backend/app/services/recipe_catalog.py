@@ -0,0 +1,530 @@
+import csv
+import hashlib
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from urllib.parse import quote
+from typing import Optional
+
+import numpy as np
+
+from app.services.diet_flags import (
+    mask_from_flags_row,
+    mask_from_restrictions,
+    superset_counts,
+    tags_from_mask,
+)
+from app.services import recipe_snapshot
+from app.services.recipe_images import ImageIndex
+from app.services.recipe_recommend import MacroMatrix, build_macro_matrix
+from app.services.recipe_search import SearchIndex
+
+BASE_DIR = Path(__file__).resolve().parent.parent.parent.parent
+RECIPES_DIR = BASE_DIR / "data" / "recipes"
+CSV_DIR = RECIPES_DIR / "csv"
+IMAGES_DIR = RECIPES_DIR / "images"
+
+MEAL_CSV_FILES = [
+    ("Breakfast", "Breakfast.Recipe.Database.2.13.csv"),
+    ("Lunch", "Lunch.Recipe.Database.2.13.csv"),
+    ("Dinner", "Dinner.Recipe.Database.2.13.csv"),
+    ("Dessert", "Dessert.Recipe.Database.2.13.csv"),
+]
+DIET_FLAGS_FILE = "Recipe.Database.Diet.Flags.2.13.csv"
+
+image_index = ImageIndex(IMAGES_DIR)
+
+# how often (seconds) we stat the csv files to see if the catalog is stale
+CHECK_INTERVAL = float(os.getenv("RECIPE_CATALOG_CHECK_INTERVAL", "2"))
+
+
+def _normalize_header(key):
+    k = (key or "").strip()
+    if "Recipe Title" in k:
+        return "Recipe Title"
+    if "Serving Size" in k:
+        return "Serving Size"
+    if "Total Preparation" in k or "Preparation Time" in k:
+        return "Total Preparation Time (min)"
+    if k == "Ingredients":
+        return "Ingredients"
+    if k == "Steps":
+        return "Steps"
+    if "Total Calories" in k or "Calories" in k:
+        return "calories"
+    if "Protein" in k and "Per Serving" in k:
+        return "protein_g"
+    if "Carbohydrates" in k:
+        return "carbs_g"
+    if "Fat (g)" in k or ("Fat" in k and "Per" in k):
+        return "fat_g"
+    if "Fiber" in k:
+        return "fiber_g"
+    if "Sodium" in k:
+        return "sodium_mg"
+    return k
+
+
+def _slug(title):
+    if not title:
+        return ""
+    lower = title.lower()
+    letters_and_digits = re.sub(r"[^a-z0-9]+", "", lower)
+    return letters_and_digits
+
+
+# fields the loader pulls out of each meal csv, as named by _normalize_header
+CSV_FIELDS = (
+    "Recipe Title", "Serving Size", "Total Preparation Time (min)", "Ingredients", "Steps",
+    "calories", "protein_g", "carbs_g", "fat_g", "fiber_g", "sodium_mg",
+)
+# looser substring matches tried when no header normalizes to the field
+_FALLBACK_SUBSTRINGS = {
+    "calories": "Calories",
+    "protein_g": "Protein",
+    "carbs_g": "Carbohydrates",
+    "fat_g": "Fat",
+    "fiber_g": "Fiber",
+    "sodium_mg": "Sodium",
+}
+
+TEXT_FIELDS = ("title", "category", "serving_size", "minutes", "ingredients", "steps", "slug")
+NUMERIC_FIELDS = ("calories", "protein_g", "carbs_g", "fat_g", "fiber_g", "sodium_mg")
+# order of the fields in the API response
+RECIPE_FIELDS = (
+    "title", "category", "serving_size", "minutes", "ingredients", "steps",
+    "calories", "protein_g", "carbs_g", "fat_g", "fiber_g", "sodium_mg",
+    "slug", "dietary_tags", "image_filename", "image_url",
+)
+
+
+class Recipe:
+    """One recipe row. Slots instead of a dict per recipe; to_dict() at the API boundary."""
+    __slots__ = RECIPE_FIELDS
+
+    def __init__(self, **values):
+        for name in RECIPE_FIELDS:
+            setattr(self, name, values.get(name))
+
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+    def get(self, name, default=None):
+        return getattr(self, name, default)
+
+    def to_dict(self, field_names=RECIPE_FIELDS):
+        return {name: getattr(self, name) for name in field_names}
+
+    def copy(self, **changes):
+        values = self.to_dict()
+        values.update(changes)
+        return Recipe(**values)
+
+
+def _compile_columns(header):
+    """Resolve each CSV_FIELDS name to a column index once per file (None if absent).
+
+    Same rules as looking the field up per row: the first header that normalizes to it,
+    else the first header containing the fallback substring. When a header name repeats
+    the last column wins, like csv.DictReader.
+    """
+    last_index = {}
+    for i, name in enumerate(header):
+        last_index[name] = i
+    names = list(last_index)
+
+    columns = {}
+    for field_name in CSV_FIELDS:
+        index = None
+        for name in names:
+            if _normalize_header(name) == field_name:
+                index = last_index[name]
+                break
+        if index is None and field_name in _FALLBACK_SUBSTRINGS:
+            for name in names:
+                if _FALLBACK_SUBSTRINGS[field_name] in name:
+                    index = last_index[name]
+                    break
+        columns[field_name] = index
+    return columns
+
+
+def _parse_number(s):
+    if s is None or s == "":
+        return None
+    text = str(s).strip().replace(",", ".")
+    if "-" in text and not text.startswith("-"):
+        text = text.split("-")[0].strip()
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def _parse_recipe_row(row, columns, category):
+    def cell(field_name):
+        index = columns[field_name]
+        if index is None or index >= len(row):
+            return ""
+        return row[index]
+
+    title = cell("Recipe Title").strip()
+    if not title:
+        return None
+
+    return Recipe(
+        title=title,
+        category=category,
+        serving_size=cell("Serving Size").strip(),
+        minutes=cell("Total Preparation Time (min)").strip(),
+        ingredients=cell("Ingredients").strip(),
+        steps=cell("Steps").strip(),
+        calories=_parse_number(cell("calories")),
+        protein_g=_parse_number(cell("protein_g")),
+        carbs_g=_parse_number(cell("carbs_g")),
+        fat_g=_parse_number(cell("fat_g")),
+        fiber_g=_parse_number(cell("fiber_g")),
+        sodium_mg=_parse_number(cell("sodium_mg")),
+        slug=_slug(title),
+    )
+
+
+def _load_recipe_rows():
+    recipes = []
+    for category, filename in MEAL_CSV_FILES:
+        path = CSV_DIR / filename
+        if not path.is_file():
+            continue
+        with open(path, newline="", encoding="utf-8", errors="replace") as f:
+            reader = csv.reader(f)
+            header = next(reader, None)
+            if header is None:
+                continue
+            columns = _compile_columns(header)
+            for row in reader:
+                rec = _parse_recipe_row(row, columns, category)
+                if rec is not None:
+                    recipes.append(rec)
+    return recipes
+
+
+def _load_diet_flags():
+    path = CSV_DIR / DIET_FLAGS_FILE
+    if not path.is_file():
+        return {}
+    flags_by_key = {}
+    with open(path, newline="", encoding="utf-8", errors="replace") as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            cat = (row.get("Category") or "").strip()
+            title = (row.get("Recipe Title") or "").strip()
+            key = (cat, title)
+            row_clean = {}
+            for k, v in row.items():
+                if not k:
+                    continue
+                if k.strip() in ("Category", "Recipe Title", "Net Carbs (g) Per Serving", "Notes"):
+                    continue
+                row_clean[k.strip()] = (v or "").strip()
+            flags_by_key[key] = row_clean
+    return flags_by_key
+
+
+def _source_paths():
+    paths = [CSV_DIR / filename for _, filename in MEAL_CSV_FILES]
+    paths.append(CSV_DIR / DIET_FLAGS_FILE)
+    return paths
+
+
+def _stat_fingerprint():
+    """(name, mtime_ns, size) for every source csv, None for missing files."""
+    out = []
+    for path in _source_paths():
+        try:
+            st = path.stat()
+            out.append((path.name, st.st_mtime_ns, st.st_size))
+        except OSError:
+            out.append((path.name, None, None))
+    return tuple(out)
+
+
+def _content_hash():
+    h = hashlib.sha256()
+    for path in _source_paths():
+        h.update(path.name.encode())
+        if path.is_file():
+            h.update(path.read_bytes())
+    return h.hexdigest()
+
+
+@dataclass(frozen=True)
+class RecipeCatalog:
+    """Immutable snapshot of the recipe database. Recipe records are shared, treat them as read-only."""
+    recipes: tuple
+    version: str
+    built_at: float
+    build_seconds: float
+    source_bytes: int
+    source: str = "csv"
+    image_generation: int = 0
+    by_slug: dict = field(default_factory=dict)
+    # diet flag bitmask per recipe (parallel to recipes), see diet_flags.py
+    diet_masks: Optional[np.ndarray] = None
+    restriction_counts: list = field(default_factory=list)
+    # NUMERIC_FIELDS plus "minutes" (prep time parsed to a number) as float64 arrays
+    # parallel to recipes, NaN where the csv had no value
+    columns: dict = field(default_factory=dict)
+    categories: tuple = ()
+    category_codes: Optional[np.ndarray] = None
+    # newest mtime of the source csvs, used for Last-Modified
+    last_modified: float = 0.0
+    search_index: Optional[SearchIndex] = None
+    macro_matrix: Optional[MacroMatrix] = None
+
+    @property
+    def etag_base(self) -> str:
+        return f"{self.version}.{self.image_generation}"
+
+    def _allowed(self, user_restrictions):
+        mask = mask_from_restrictions(user_restrictions)
+        return (self.diet_masks & mask) == mask
+
+    def filter_by_restrictions(self, user_restrictions) -> list:
+        if not mask_from_restrictions(user_restrictions):
+            return list(self.recipes)
+        return [self.recipes[i] for i in np.flatnonzero(self._allowed(user_restrictions))]
+
+    def select(self, user_restrictions=None, category=None, max_minutes=None, ranges=None) -> list:
+        """Filter by restrictions, category, prep time and {"calories": (lo, hi), ...} ranges.
+
+        Recipes missing a value that a filter needs are left out (NaN compares false).
+        """
+        keep = self._allowed(user_restrictions)
+        if category:
+            category = category.strip().lower()
+            codes = [i for i, c in enumerate(self.categories) if c.lower() == category]
+            keep &= np.isin(self.category_codes, codes)
+        if max_minutes is not None:
+            keep &= self.columns["minutes"] <= max_minutes
+        for key, (lo, hi) in (ranges or {}).items():
+            if lo is not None:
+                keep &= self.columns[key] >= lo
+            if hi is not None:
+                keep &= self.columns[key] <= hi
+        return [self.recipes[i] for i in np.flatnonzero(keep)]
+
+    def search(self, query, user_restrictions=None, limit=20):
+        """([(recipe, score)], number of matching recipes) for a full-text query."""
+        allowed = None
+        if mask_from_restrictions(user_restrictions):
+            allowed = self._allowed(user_restrictions).tolist()
+        top, total = self.search_index.search(query, allowed, limit)
+        return [(self.recipes[doc_id], score) for doc_id, score in top], total
+
+    def count_matching(self, user_restrictions) -> int:
+        return self.restriction_counts[mask_from_restrictions(user_restrictions)]
+
+
+def _with_image(recipe):
+    filename = image_index.resolve(recipe.slug)
+    image_url = None
+    if filename:
+        # content-hashed url so the image route can send immutable cache headers
+        image_url = f"/recipes/images/{quote(filename)}?v={image_index.content_hash(filename)}"
+    return recipe.copy(image_filename=filename, image_url=image_url)
+
+
+def _parse_sources():
+    """(recipes without tags/images, diet masks) from the csv files."""
+    rows = _load_recipe_rows()
+    flags = _load_diet_flags()
+    masks = [mask_from_flags_row(flags.get((r.category, r.title))) for r in rows]
+    return rows, np.array(masks, dtype=np.int64)
+
+
+def _load_snapshot(content_hash):
+    loaded = recipe_snapshot.load_snapshot(recipe_snapshot.SNAPSHOT_PATH, content_hash, TEXT_FIELDS, NUMERIC_FIELDS)
+    if loaded is None:
+        return None
+    text_rows, numbers, masks = loaded
+    rows = []
+    for i, text in enumerate(text_rows):
+        values = dict(text)
+        for j, name in enumerate(NUMERIC_FIELDS):
+            v = numbers[i, j]
+            values[name] = None if np.isnan(v) else float(v)
+        rows.append(Recipe(**values))
+    return rows, masks, numbers
+
+
+def build_catalog(content_hash: Optional[str] = None) -> RecipeCatalog:
+    start = time.perf_counter()
+    content_hash = content_hash or _content_hash()
+    image_index.refresh()
+
+    source = "snapshot"
+    loaded = _load_snapshot(content_hash)
+    if loaded is not None:
+        rows, masks, numbers = loaded
+    else:
+        source = "csv"
+        rows, masks = _parse_sources()
+        numbers = None
+
+    recipes = []
+    by_slug = {}
+    for r, mask in zip(rows, masks.tolist()):
+        r.dietary_tags = tags_from_mask(mask)
+        recipe = _with_image(r)
+        recipes.append(recipe)
+        by_slug.setdefault(recipe.slug, recipe)
+
+    columns = {}
+    for j, name in enumerate(NUMERIC_FIELDS):
+        if numbers is not None:
+            columns[name] = numbers[:, j]
+        else:
+            columns[name] = np.array([np.nan if getattr(r, name) is None else getattr(r, name) for r in recipes], dtype=np.float64)
+    minutes = [_parse_number(r.minutes) for r in recipes]
+    columns["minutes"] = np.array([np.nan if m is None else m for m in minutes], dtype=np.float64)
+
+    categories = tuple(dict.fromkeys(r.category for r in recipes))
+    category_codes = np.array([categories.index(r.category) for r in recipes], dtype=np.int16)
+
+    stats = [p.stat() for p in _source_paths() if p.is_file()]
+    return RecipeCatalog(
+        recipes=tuple(recipes),
+        version=content_hash[:16],
+        built_at=time.time(),
+        build_seconds=time.perf_counter() - start,
+        source_bytes=sum(st.st_size for st in stats),
+        source=source,
+        image_generation=image_index.generation,
+        by_slug=by_slug,
+        diet_masks=masks,
+        restriction_counts=superset_counts(masks.tolist()),
+        columns=columns,
+        categories=categories,
+        category_codes=category_codes,
+        last_modified=max((st.st_mtime for st in stats), default=0.0),
+        search_index=SearchIndex.build(recipes),
+        macro_matrix=build_macro_matrix(columns, masks),
+    )
+
+
+def write_snapshot(path=None):
+    """Parse the csvs and write the binary snapshot build_catalog() loads when it is current."""
+    rows, masks = _parse_sources()
+    return recipe_snapshot.write_snapshot(
+        path or recipe_snapshot.SNAPSHOT_PATH, _content_hash(), rows, masks.tolist(), TEXT_FIELDS, NUMERIC_FIELDS,
+    )
+
+
+_lock = threading.Lock()
+_catalog: Optional[RecipeCatalog] = None
+_fingerprint = None
+_content_digest = None
+_last_check = 0.0
+_metrics = {
+    "builds": 0,
+    "reload_checks": 0,
+    "skipped_rebuilds": 0,
+    "image_relinks": 0,
+    "last_build_seconds": None,
+    "total_build_seconds": 0.0,
+}
+
+
+def _relink_images(catalog: RecipeCatalog) -> RecipeCatalog:
+    # images were added or removed but the csvs did not change
+    recipes = []
+    by_slug = {}
+    for r in catalog.recipes:
+        recipe = _with_image(r)
+        recipes.append(recipe)
+        by_slug.setdefault(recipe.slug, recipe)
+    return replace(catalog, recipes=tuple(recipes), by_slug=by_slug, image_generation=image_index.generation)
+
+
+def _relink_if_images_changed():
+    global _catalog
+
+    image_index.refresh()
+    if image_index.generation != _catalog.image_generation:
+        _catalog = _relink_images(_catalog)
+        _metrics["image_relinks"] += 1
+    return _catalog
+
+
+def _rebuild_locked(force=False):
+    global _catalog, _fingerprint, _content_digest
+
+    fingerprint = _stat_fingerprint()
+    if not force and _catalog is not None and fingerprint == _fingerprint:
+        return _relink_if_images_changed()
+
+    digest = _content_hash()
+    if not force and _catalog is not None and digest == _content_digest:
+        # files were touched but not changed, keep the current catalog
+        _fingerprint = fingerprint
+        _metrics["skipped_rebuilds"] += 1
+        return _relink_if_images_changed()
+
+    catalog = build_catalog(digest)
+    _catalog = catalog
+    _fingerprint = fingerprint
+    _content_digest = digest
+    _metrics["builds"] += 1
+    _metrics["last_build_seconds"] = catalog.build_seconds
+    _metrics["total_build_seconds"] += catalog.build_seconds
+    print(f"Recipe catalog built: {len(catalog.recipes)} recipes in {catalog.build_seconds * 1000:.1f} ms (version {catalog.version})")
+    return catalog
+
+
+def get_catalog() -> RecipeCatalog:
+    """Return the current catalog, rebuilding it if the csv files changed since the last check."""
+    global _last_check
+
+    now = time.monotonic()
+    if _catalog is not None and now - _last_check < CHECK_INTERVAL:
+        return _catalog
+
+    with _lock:
+        _last_check = time.monotonic()
+        _metrics["reload_checks"] += 1
+        return _rebuild_locked()
+
+
+def reload_catalog(force: bool = True) -> RecipeCatalog:
+    """Reload hook, called by POST /recipes/catalog/reload or after the csv files are replaced."""
+    global _last_check
+
+    with _lock:
+        _last_check = time.monotonic()
+        return _rebuild_locked(force=force)
+
+
+def image_report() -> dict:
+    """Startup report of recipes with no image or an ambiguous fuzzy image match."""
+    catalog = get_catalog()
+    return image_index.report([r.slug for r in catalog.recipes])
+
+
+def catalog_metrics() -> dict:
+    catalog = _catalog
+    out = dict(_metrics)
+    if catalog is None:
+        out.update({"loaded": False})
+        return out
+    out.update({
+        "loaded": True,
+        "version": catalog.version,
+        "source": catalog.source,
+        "recipe_count": len(catalog.recipes),
+        "source_bytes": catalog.source_bytes,
+        "built_at": catalog.built_at,
+    })
+    return out
@@ -0,0 +1,143 @@
+import hashlib
+import re
+import threading
+from pathlib import Path
+
+IMAGE_EXTENSIONS = [".jpg", ".jpeg", ".png", ".webp"]
+
+
+def _normalize_stem(stem):
+    return re.sub(r"[^a-z0-9]+", "", stem.lower())
+
+
+def _fuzzy_match(slug, stem_norm):
+    # exact normalized stem, or a long enough stem/slug contained in the other
+    if stem_norm == slug:
+        return True
+    if len(slug) >= 10 and stem_norm in slug:
+        return True
+    if len(stem_norm) >= 10 and slug in stem_norm:
+        return True
+    return False
+
+
+class ImageIndex:
+    """slug -> image filename lookup built from one listing of the images directory.
+
+    refresh() only re-lists the directory when its mtime changes, then applies the
+    added/removed files and drops the cached resolutions they could affect.
+    """
+
+    def __init__(self, images_dir: Path):
+        self.images_dir = images_dir
+        self.generation = 0
+        self._files = {}  # filename -> normalized stem
+        self._by_stem = {}  # normalized stem -> sorted filenames
+        self._resolved = {}  # slug -> (filename or None, candidates)
+        self._dir_mtime = None
+        self._hashes = {}  # filename -> ((mtime_ns, size), sha256 prefix)
+        self._lock = threading.Lock()
+
+    def _list_files(self):
+        if not self.images_dir.is_dir():
+            return set()
+        return {p.name for p in self.images_dir.iterdir() if p.is_file()}
+
+    def refresh(self):
+        try:
+            mtime = self.images_dir.stat().st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime == self._dir_mtime and self.generation:
+            return False
+
+        with self._lock:
+            current = self._list_files()
+            added = current - self._files.keys()
+            removed = self._files.keys() - current
+            self._dir_mtime = mtime
+            if not added and not removed and self.generation:
+                return False
+
+            changed_stems = set()
+            for name in removed:
+                self._hashes.pop(name, None)
+                stem_norm = self._files.pop(name)
+                names = self._by_stem.get(stem_norm, [])
+                if name in names:
+                    names.remove(name)
+                if not names:
+                    self._by_stem.pop(stem_norm, None)
+                changed_stems.add(stem_norm)
+            for name in added:
+                stem_norm = _normalize_stem(Path(name).stem)
+                self._files[name] = stem_norm
+                self._by_stem.setdefault(stem_norm, []).append(name)
+                self._by_stem[stem_norm].sort()
+                changed_stems.add(stem_norm)
+
+            for slug in list(self._resolved):
+                if any(_fuzzy_match(slug, s) for s in changed_stems) or any((slug + ext) in added or (slug + ext) in removed for ext in IMAGE_EXTENSIONS):
+                    del self._resolved[slug]
+
+            self.generation += 1
+            return True
+
+    def _resolve_uncached(self, slug):
+        for ext in IMAGE_EXTENSIONS:
+            if (slug + ext) in self._files:
+                return slug + ext, [slug + ext]
+
+        candidates = list(self._by_stem.get(slug, []))
+        for stem_norm in sorted(self._by_stem):
+            if stem_norm != slug and _fuzzy_match(slug, stem_norm):
+                candidates.extend(self._by_stem[stem_norm])
+        return (candidates[0] if candidates else None), candidates
+
+    def resolve(self, slug):
+        if not slug:
+            return None
+        hit = self._resolved.get(slug)
+        if hit is None:
+            with self._lock:
+                hit = self._resolve_uncached(slug)
+                self._resolved[slug] = hit
+        return hit[0]
+
+    def content_hash(self, filename):
+        """Short sha256 of the file, cached until its mtime or size changes. None if missing."""
+        path = self.images_dir / filename
+        try:
+            st = path.stat()
+        except OSError:
+            return None
+        key = (st.st_mtime_ns, st.st_size)
+        cached = self._hashes.get(filename)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        digest = hashlib.sha256(path.read_bytes()).hexdigest()[:16]
+        self._hashes[filename] = (key, digest)
+        return digest
+
+    def report(self, slugs):
+        """Recipes with no image, and recipes whose fuzzy match had more than one candidate."""
+        missing = []
+        ambiguous = {}
+        for slug in slugs:
+            if not slug:
+                continue
+            filename = self.resolve(slug)
+            candidates = self._resolved[slug][1]
+            if filename is None:
+                missing.append(slug)
+            elif len(candidates) > 1:
+                ambiguous[slug] = candidates
+        return {"missing": sorted(missing), "ambiguous": ambiguous}
+
+
+def print_image_report(report):
+    for slug in report["missing"]:
+        print(f"Recipe image missing: {slug}")
+    for slug, candidates in report["ambiguous"].items():
+        print(f"Recipe image ambiguous: {slug} -> {', '.join(candidates)} (using {candidates[0]})")
+    return report
@@ -0,0 +1,119 @@
+"""Recipe recommendations that fit what is left of a user's macros for today.
+
+Every recipe is a row of (calories, protein_g, carbs_g, fat_g) in one NumPy matrix. A
+user's remaining-for-today vector is compared against every allowed row at once and
+the K closest rows (weighted, relative to the user's goals) are returned.
+
+Benchmark against a synthetic catalog with:
+
+    python -m app.services.recipe_recommend --scale 100
+"""
+import argparse
+import os
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+from app.services.tdee import calculate_macros
+
+MACRO_KEYS = ("calories", "protein_g", "carbs_g", "fat_g")
+# calories matter most, a recipe 20% over on calories is worse than 20% over on fat
+MACRO_WEIGHTS = np.array([2.0, 1.0, 1.0, 1.0])
+# going over what is left counts this much more than staying under it
+OVER_PENALTY = 2.0
+
+DEFAULT_CALORIE_GOAL = 2000
+LATENCY_BUDGET_MS = float(os.getenv("RECOMMEND_LATENCY_BUDGET_MS", "5"))
+
+
+@dataclass(frozen=True)
+class MacroMatrix:
+    values: np.ndarray  # (n recipes, 4), NaN where the csv had no number
+    masks: np.ndarray  # (n recipes,) diet flag bitmasks
+    complete: np.ndarray  # rows with all four macros present
+
+
+def build_macro_matrix(columns, diet_masks) -> MacroMatrix:
+    """From the catalog's typed numeric columns ({"calories": float64 array, ...})."""
+    values = np.column_stack([np.asarray(columns[k], dtype=np.float64) for k in MACRO_KEYS])
+    return MacroMatrix(
+        values=values,
+        masks=np.array(diet_masks, dtype=np.int64),
+        complete=~np.isnan(values).any(axis=1),
+    )
+
+
+def macro_goals(profile) -> np.ndarray:
+    """(calories, protein, carbs, fat) goals from the profile, default split when unset."""
+    calorie_goal = (profile.calorie_goal if profile is not None else None) or DEFAULT_CALORIE_GOAL
+    defaults = calculate_macros(calorie_goal)
+    protein = getattr(profile, "protein_g", None) or defaults.protein_g
+    carbs = getattr(profile, "carbs_g", None) or defaults.carbs_g
+    fats = getattr(profile, "fats_g", None) or defaults.fats_g
+    return np.array([calorie_goal, protein, carbs, fats], dtype=np.float64)
+
+
+def eaten_today(meals) -> np.ndarray:
+    eaten = np.zeros(len(MACRO_KEYS))
+    for m in meals:
+        eaten += (m.calories or 0, m.protein or 0, m.carbs or 0, m.fats or 0)
+    return eaten
+
+
+def recommend(matrix: MacroMatrix, goals, remaining, mask=0, k=5, meals_left=1):
+    """Indexes of the k recipes closest to remaining / meals_left, with their distances."""
+    target = np.maximum(remaining, 0) / max(meals_left, 1)
+    allowed = matrix.complete & ((matrix.masks & mask) == mask)
+    idx = np.flatnonzero(allowed)
+    if idx.size == 0:
+        return idx, np.empty(0)
+
+    # relative to the goal so grams and calories are comparable
+    diff = (matrix.values[idx] - target) / np.maximum(goals, 1.0)
+    diff = np.where(diff > 0, diff * OVER_PENALTY, diff)
+    dist = np.sqrt(((diff ** 2) * MACRO_WEIGHTS).sum(axis=1))
+
+    k = min(k, idx.size)
+    top = np.argpartition(dist, k - 1)[:k]
+    top = top[np.argsort(dist[top])]
+    return idx[top], dist[top]
+
+
+def _bench(scale, runs):
+    from app.services.recipe_catalog import get_catalog
+
+    catalog = get_catalog()
+    columns = {k: np.tile(catalog.columns[k], scale) for k in MACRO_KEYS}
+    masks = np.tile(catalog.diet_masks, scale)
+    start = time.perf_counter()
+    matrix = build_macro_matrix(columns, masks)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    goals = np.array([2000.0, 100.0, 225.0, 78.0])
+    rng = np.random.default_rng(0)
+    timings = []
+    for _ in range(runs):
+        remaining = goals * rng.uniform(0, 1, size=4)
+        mask = int(rng.choice(masks))
+        start = time.perf_counter()
+        recommend(matrix, goals, remaining, mask, k=5, meals_left=2)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    timings.sort()
+    p50 = timings[len(timings) // 2]
+    p99 = timings[int(len(timings) * 0.99) - 1]
+    print(f"{len(masks)} recipes, matrix built in {build_ms:.1f} ms")
+    print(f"recommend p50 {p50:.3f} ms, p99 {p99:.3f} ms (budget {LATENCY_BUDGET_MS} ms)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the macro recommender.")
+    parser.add_argument("--scale", type=int, default=100, help="copies of the catalog to search")
+    parser.add_argument("--runs", type=int, default=1000)
+    args = parser.parse_args()
+    _bench(args.scale, args.runs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import heapq
+import math
+import re
+from bisect import bisect_left
+
+# title matches count more than ingredient matches, which count more than steps
+FIELD_WEIGHTS = {"title": 3.0, "ingredients": 2.0, "steps": 1.0}
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+MIN_PREFIX_LEN = 2
+MAX_PREFIX_EXPANSIONS = 50
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "into", "is", "it",
+    "of", "on", "or", "the", "to", "until", "with", "your", "you", "if", "then", "cup", "cups",
+    "tbsp", "tsp", "oz", "g", "lb", "lbs",
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def stem(word):
+    """Very small suffix stripper, enough to match tomato/tomatoes and bake/baked/baking."""
+    if len(word) <= 3:
+        return word
+    word = _strip_suffix(word)
+    # bake/baked/baking all end up as "bak", slice/sliced/slicing as "slic"
+    if word.endswith("e") and len(word) > 3:
+        return word[:-1]
+    return word
+
+
+def _strip_suffix(word):
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith("oes"):
+        return word[:-2]
+    if word.endswith(("ches", "shes", "sses", "xes")):
+        return word[:-2]
+    if word.endswith("ing") and len(word) > 5:
+        return word[:-3]
+    if word.endswith("ed") and len(word) > 4:
+        return word[:-2]
+    if word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    return [stem(t) for t in _TOKEN_RE.findall((text or "").lower()) if t not in STOPWORDS]
+
+
+class SearchIndex:
+    """Inverted index over recipe title / ingredients / steps, ranked with BM25.
+
+    Doc ids are positions in the catalog's recipes tuple, so the user's diet
+    restrictions are checked while walking the postings instead of afterward.
+    """
+
+    def __init__(self, postings, doc_lengths):
+        self.doc_count = len(doc_lengths)
+        self.avg_length = (sum(doc_lengths) / self.doc_count) if self.doc_count else 0.0
+        if not self.avg_length:
+            self.avg_length = 1.0
+        self.vocabulary = sorted(postings)
+        self.idf = {
+            term: math.log(1 + (self.doc_count - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in postings.items()
+        }
+        # the BM25 tf part only depends on the doc, so it is computed once here and a
+        # query is just idf * weight summed over the postings
+        self.postings = {}  # term -> (doc ids, bm25 tf weights)
+        for term, docs in postings.items():
+            doc_ids = []
+            weights = []
+            for doc_id, freq in docs:
+                norm = K1 * (1 - B + B * doc_lengths[doc_id] / self.avg_length)
+                doc_ids.append(doc_id)
+                weights.append(freq * (K1 + 1) / (freq + norm))
+            self.postings[term] = (doc_ids, weights)
+
+    @classmethod
+    def build(cls, recipes):
+        postings = {}
+        doc_lengths = []
+        for doc_id, recipe in enumerate(recipes):
+            tf = {}
+            length = 0.0
+            for field_name, weight in FIELD_WEIGHTS.items():
+                tokens = tokenize(recipe.get(field_name))
+                length += weight * len(tokens)
+                for token in tokens:
+                    tf[token] = tf.get(token, 0.0) + weight
+            doc_lengths.append(length)
+            for term, freq in tf.items():
+                postings.setdefault(term, []).append((doc_id, freq))
+        return cls(postings, doc_lengths)
+
+    def _expand_prefix(self, prefix):
+        start = bisect_left(self.vocabulary, prefix)
+        out = []
+        for term in self.vocabulary[start:start + MAX_PREFIX_EXPANSIONS]:
+            if not term.startswith(prefix):
+                break
+            out.append(term)
+        return out
+
+    def query_terms(self, query):
+        """Stemmed query terms; the last word also matches as a prefix (search-as-you-type)."""
+        raw = [t for t in _TOKEN_RE.findall((query or "").lower()) if t not in STOPWORDS]
+        terms = {}
+        for i, word in enumerate(raw):
+            stemmed = stem(word)
+            terms[stemmed] = 1.0
+            if i == len(raw) - 1 and len(word) >= MIN_PREFIX_LEN:
+                for term in self._expand_prefix(word):
+                    # prefix hits score a bit less than the word itself
+                    terms.setdefault(term, 0.5)
+        return terms
+
+    def search(self, query, allowed=None, limit=20):
+        """([(doc_id, score)] best first, number of matches). allowed[doc_id] False skips a doc."""
+        scores = {}
+        get = scores.get
+        for term, boost in self.query_terms(query).items():
+            entry = self.postings.get(term)
+            if entry is None:
+                continue
+            idf = self.idf[term] * boost
+            for doc_id, weight in zip(*entry):
+                if allowed is not None and not allowed[doc_id]:
+                    continue
+                scores[doc_id] = get(doc_id, 0.0) + idf * weight
+        top = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        return top, len(scores)
@@ -0,0 +1,124 @@
+"""Prevalidated binary snapshot of the parsed recipe csvs.
+
+Written at build/deploy time, loaded at startup with mmap instead of re-parsing csv
+text. The snapshot records the sha256 of the csvs it came from and is ignored when
+that no longer matches, so a stale file just falls back to the csv parser.
+
+Layout (little endian):
+    header      magic, format version, csv sha256, recipe count
+    numbers     float64[count, len(NUMERIC_FIELDS)], NaN for missing
+    masks       int64[count] diet flag bitmasks
+    offsets     uint32[count * len(TEXT_FIELDS) + 1] into the text blob
+    text        utf-8
+
+    python -m app.services.recipe_snapshot
+"""
+import mmap
+import os
+import struct
+from pathlib import Path
+
+import numpy as np
+
+MAGIC = b"CHOMPRCP"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<8sI32sI")
+
+SNAPSHOT_PATH = Path(os.getenv("RECIPE_SNAPSHOT_PATH", Path(__file__).resolve().parent.parent.parent / ".recipe_snapshot"))
+
+
+def _validate(recipes, masks, numeric_fields):
+    if len(recipes) != len(masks):
+        raise ValueError("recipes and masks differ in length")
+    for r in recipes:
+        if not r.title or not r.slug:
+            raise ValueError(f"recipe without a title/slug: {r.title!r}")
+        for name in numeric_fields:
+            v = getattr(r, name)
+            if v is not None and not np.isfinite(v):
+                raise ValueError(f"{r.title}: {name} is not a finite number")
+
+
+def write_snapshot(path, content_hash, recipes, masks, text_fields, numeric_fields):
+    _validate(recipes, masks, numeric_fields)
+    count = len(recipes)
+    numbers = np.array(
+        [[np.nan if getattr(r, k) is None else getattr(r, k) for k in numeric_fields] for r in recipes],
+        dtype="<f8",
+    ).reshape(count, len(numeric_fields))
+
+    blob = bytearray()
+    offsets = [0]
+    for r in recipes:
+        for name in text_fields:
+            blob += (getattr(r, name) or "").encode("utf-8")
+            offsets.append(len(blob))
+
+    tmp = Path(str(path) + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, bytes.fromhex(content_hash), count))
+        f.write(numbers.tobytes())
+        f.write(np.asarray(masks, dtype="<i8").tobytes())
+        f.write(np.asarray(offsets, dtype="<u4").tobytes())
+        f.write(bytes(blob))
+    os.replace(tmp, path)
+    return path
+
+
+def load_snapshot(path, content_hash, text_fields, numeric_fields):
+    """(text rows, numbers array, masks array) or None if missing, stale or malformed.
+
+    The numbers and masks arrays are views over the mmap, nothing is copied.
+    """
+    try:
+        f = open(path, "rb")
+    except OSError:
+        return None
+    with f:
+        size = os.fstat(f.fileno()).st_size
+        if size < _HEADER.size:
+            return None
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, digest, count = _HEADER.unpack_from(mm, 0)
+    if magic != MAGIC or version != FORMAT_VERSION or digest.hex() != content_hash:
+        mm.close()
+        return None
+
+    n_numeric = len(numeric_fields)
+    n_offsets = count * len(text_fields) + 1
+    pos = _HEADER.size
+    numbers_end = pos + count * n_numeric * 8
+    masks_end = numbers_end + count * 8
+    offsets_end = masks_end + n_offsets * 4
+    # the last text offset is the length of the text section; check it before numpy
+    # views are taken, since the mmap can't be closed while they exist
+    if size < offsets_end or size != offsets_end + struct.unpack_from("<I", mm, offsets_end - 4)[0]:
+        mm.close()
+        return None
+
+    numbers = np.frombuffer(mm, dtype="<f8", count=count * n_numeric, offset=pos).reshape(count, n_numeric)
+    masks = np.frombuffer(mm, dtype="<i8", count=count, offset=numbers_end)
+    offsets = np.frombuffer(mm, dtype="<u4", count=n_offsets, offset=masks_end).tolist()
+
+    text = mm[offsets_end:]
+    rows = []
+    i = 0
+    for _ in range(count):
+        row = {}
+        for name in text_fields:
+            row[name] = text[offsets[i]:offsets[i + 1]].decode("utf-8")
+            i += 1
+        rows.append(row)
+    return rows, numbers, masks
+
+
+def main():
+    from app.services import recipe_catalog
+
+    path = recipe_catalog.write_snapshot()
+    print(f"Wrote recipe snapshot to {path}")
+
+
+if __name__ == "__main__":
+    main()
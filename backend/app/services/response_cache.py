@@ -0,0 +1,172 @@
+"""Content-addressed cache of model replies.
+
+The key is a sha256 over the model name, its system instruction, the prompt with
+whitespace collapsed, and for photos a perceptual hash of the decoded image, so the
+same question asked with the same context (or the same photo uploaded again, even
+re-encoded or resized) is answered without another Gemini call.
+
+Replies live in a bounded in-memory LRU with a TTL. Setting LLM_CACHE_PATH adds a
+persistent SQLite tier that survives restarts and is shared by workers on one host;
+its reads and writes run in a worker thread so they never block the event loop.
+Callers must not store replies that carry side effects (a LOG_MEAL block).
+"""
+import asyncio
+import hashlib
+import io
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from PIL import Image
+
+MAX_ENTRIES = int(os.getenv("LLM_CACHE_SIZE", "2048"))
+MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_MB", "32")) * 1024 * 1024
+TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL", "3600"))
+CACHE_PATH = os.getenv("LLM_CACHE_PATH", "")
+PRUNE_EVERY = 500  # persistent-tier puts between deletes of expired rows
+
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_prompt(text):
+    return _SPACES.sub(" ", text or "").strip()
+
+
+def image_hash(data, size=16):
+    """Difference hash of the decoded image, size*size bits as hex.
+
+    Compares neighbouring pixels of a small grayscale copy, so re-encoding, resizing
+    and EXIF changes give the same hash while a different photo does not.
+    """
+    img = Image.open(io.BytesIO(data))
+    img.draft("L", (size * 8, size * 8))  # jpeg decodes at reduced scale, much cheaper
+    small = img.convert("L").resize((size + 1, size), Image.Resampling.LANCZOS)
+    pixels = small.tobytes()
+    bits = 0
+    for y in range(size):
+        row = pixels[y * (size + 1):(y + 1) * (size + 1)]
+        for x in range(size):
+            bits = (bits << 1) | (row[x] > row[x + 1])
+    return f"{bits:0{size * size // 4}x}"
+
+
+def make_key(model_name, system_instruction, prompt, image=None):
+    h = hashlib.sha256()
+    for part in (model_name, normalize_prompt(system_instruction), normalize_prompt(prompt), image or ""):
+        h.update(part.encode())
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class _DiskTier:
+    def __init__(self, path, ttl):
+        self.ttl = ttl
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_replies ("
+            "key TEXT PRIMARY KEY, endpoint TEXT, reply TEXT, created_at REAL)"
+        )
+        self._lock = threading.Lock()
+        self._puts = 0
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT reply FROM llm_replies WHERE key = ? AND created_at > ?",
+                (key, time.time() - self.ttl),
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, key, endpoint, reply):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_replies (key, endpoint, reply, created_at) VALUES (?, ?, ?, ?)",
+                (key, endpoint, reply, time.time()),
+            )
+            self._puts += 1
+            if self._puts % PRUNE_EVERY == 0:
+                self._conn.execute("DELETE FROM llm_replies WHERE created_at <= ?", (time.time() - self.ttl,))
+
+
+class ResponseCache:
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES, ttl=TTL_SECONDS, path=CACHE_PATH):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires, reply), oldest first
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._disk = _DiskTier(path, ttl) if path else None
+        self.metrics = {}  # endpoint -> counters
+
+    def _count(self, endpoint, **deltas):
+        counters = self.metrics.setdefault(endpoint, {
+            "hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "skipped": 0,
+            "bytes_served": 0, "bytes_stored": 0,
+        })
+        for name, delta in deltas.items():
+            counters[name] += delta
+
+    def _remember(self, key, reply):
+        # caller holds the lock
+        size = len(reply.encode())
+        if size > self.max_bytes or self.max_entries <= 0:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old[1].encode())
+        self._entries[key] = (time.monotonic() + self.ttl, reply)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, (_, dropped) = self._entries.popitem(last=False)
+            self._bytes -= len(dropped.encode())
+
+    async def get(self, endpoint, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] >= time.monotonic():
+                self._entries.move_to_end(key)
+                self._count(endpoint, hits=1, bytes_served=len(entry[1].encode()))
+                return entry[1]
+            if entry is not None:
+                self._bytes -= len(self._entries.pop(key)[1].encode())
+
+        reply = await asyncio.to_thread(self._disk.get, key) if self._disk else None
+        with self._lock:
+            if reply is None:
+                self._count(endpoint, misses=1)
+                return None
+            self._remember(key, reply)
+            self._count(endpoint, hits=1, disk_hits=1, bytes_served=len(reply.encode()))
+            return reply
+
+    async def put(self, endpoint, key, reply):
+        with self._lock:
+            self._remember(key, reply)
+            self._count(endpoint, stores=1, bytes_stored=len(reply.encode()))
+        if self._disk:
+            await asyncio.to_thread(self._disk.put, key, endpoint, reply)
+
+    def skip(self, endpoint):
+        """Count a reply that was not stored because it had side effects."""
+        with self._lock:
+            self._count(endpoint, skipped=1)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "persistent": self._disk is not None,
+                "endpoints": {name: dict(c) for name, c in self.metrics.items()},
+            }
+
+
+response_cache = ResponseCache()
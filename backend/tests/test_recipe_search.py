@@ -0,0 +1,24 @@
+import pytest
+
+from app.services.recipe_search import stem, tokenize
+
+
+@pytest.mark.parametrize("forms", [
+    ["bake", "baked", "baking", "bakes"],
+    ["slice", "sliced", "slicing", "slices"],
+    ["dice", "diced", "dices"],
+    ["tomato", "tomatoes"],
+    ["berry", "berries"],
+    ["peach", "peaches"],
+])
+def test_word_forms_share_a_stem(forms):
+    assert len({stem(w) for w in forms}) == 1
+
+
+def test_short_words_are_left_alone():
+    assert stem("pie") == "pie"
+    assert stem("egg") == "egg"
+
+
+def test_tokenize_drops_stopwords_and_units():
+    assert tokenize("Baked Tomatoes with 2 cups of Rice") == [stem("bake"), "tomato", "2", stem("rice")]
@@ -27,9 +27,10 @@ export default function Learn() {
     if (tab !== "recipes") return;
     setRecipesLoading(true);
     setRecipesError(null);
-    let url = `${API_BASE}/recipes`;
+    // card grid only needs the summary fields, full recipe is fetched on click
+    let url = `${API_BASE}/recipes?fields=summary`;
     if (userEmail) {
-      url = `${API_BASE}/recipes?user_email=${encodeURIComponent(userEmail)}`;
+      url = `${API_BASE}/recipes?fields=summary&user_email=${encodeURIComponent(userEmail)}`;
     }
     fetch(url)
       .then((res) => {
@@ -51,18 +52,36 @@ export default function Learn() {
       });
   }, [tab, userEmail]);
 
-  function getRecipeImageUrl(recipe) {
+  function getRecipeImageUrl(recipe, width) {
     if (!recipe || !recipe.image_filename) {
       return null;
     }
+    // content-hashed url, cached by the browser until the image changes
+    if (recipe.image_url) {
+      const size = width ? `&w=${width}` : "";
+      return `${API_BASE}${recipe.image_url}${size}`;
+    }
     const encoded = encodeURIComponent(recipe.image_filename);
     return `${API_BASE}/recipes/images/${encoded}`;
   }
 
+  function openRecipe(recipe) {
+    setSelectedRecipe(recipe);
+    if (!recipe || !recipe.slug) return;
+    fetch(`${API_BASE}/recipes/${encodeURIComponent(recipe.slug)}`)
+      .then((res) => (res.ok ? res.json() : null))
+      .then((full) => {
+        if (full) {
+          setSelectedRecipe((current) => (current && current.slug === full.slug ? full : current));
+        }
+      })
+      .catch(() => {});
+  }
+
   function handleRecipeKeyDown(e, recipe) {
     if (e.key === "Enter" || e.key === " ") {
       e.preventDefault();
-      setSelectedRecipe(recipe);
+      openRecipe(recipe);
     }
   }
 
@@ -146,13 +165,13 @@ export default function Learn() {
                   className="learnRecipeRow"
                   role="button"
                   tabIndex={0}
-                  onClick={() => setSelectedRecipe(r)}
+                  onClick={() => openRecipe(r)}
                   onKeyDown={(e) => handleRecipeKeyDown(e, r)}
                 >
                   <div className="learnRecipeImgWrap">
                     <img
                       className="learnRecipeImg"
-                      src={getRecipeImageUrl(r) || ""}
+                      src={getRecipeImageUrl(r, 320) || ""}
                       alt={r.title}
                       onError={(e) => {
                         e.currentTarget.style.display = "none";
@@ -86,35 +86,20 @@ function TopDashboard({ userEmail, refreshKey }) {
   useEffect(() => {
     if (!userEmail) return;
 
-    fetch(`http://localhost:8000/meals/today?user_email=${encodeURIComponent(userEmail)}`)
-      .then((res) => (res.ok ? res.json() : []))
+    fetch(`http://localhost:8000/meals/summary?user_email=${encodeURIComponent(userEmail)}&tz=${encodeURIComponent(Intl.DateTimeFormat().resolvedOptions().timeZone)}`)
+      .then((res) => (res.ok ? res.json() : null))
       .then((data) => {
-        let list = [];
-        
-        if (Array.isArray(data)) {
-          list = data;
-        } else if (typeof data === 'object' && data !== null) {
-          list = Object.values(data).flat();
-        }
-
-        const totalCals = list.reduce((acc, item) => acc + (Number(item.calories) || 0), 0);
-        const totalProt = list.reduce((acc, item) => acc + (Number(item.protein) || 0), 0);
-        const totalCarbs = list.reduce((acc, item) => acc + (Number(item.carbs) || 0), 0);
-        const totalFats = list.reduce((acc, item) => acc + (Number(item.fats) || 0), 0);
-        const totalFluids = list.reduce((acc, item) => acc + (Number(item.fluids) || 0), 0);
-        
-        const totalFiber = list.reduce((acc, item) => acc + (Number(item.fiber) || 0), 0);
-        const totalSodium = list.reduce((acc, item) => acc + (Number(item.sodium) || 0), 0);
+        // totals are kept up to date by the backend, one row per day
+        const totals = data?.totals || {};
 
         setMetrics((prev) => ({
           ...prev,
-          calories: totalCals,
-          protein: totalProt,
-          carbs: totalCarbs,
-          fats: totalFats,
-          fiber: totalFiber,
-          sodiumMg: totalSodium,
-          fluidsL: totalFluids,
+          calories: Number(totals.calories) || 0,
+          protein: Number(totals.protein) || 0,
+          carbs: Number(totals.carbs) || 0,
+          fats: Number(totals.fats) || 0,
+          fiber: Number(totals.fiber) || 0,
+          sodiumMg: Number(totals.sodium) || 0,
         }));
       })
       .catch((err) => console.error("Metrics fetch failed:", err));
@@ -310,6 +295,7 @@ async function logMealWithFood(mealType, food, servingMultiplier) {
       fats: Number(fats) * mult,
       fiber: Number(fiber) * mult,
       sodium: Number(sodium) * mult,
+      timezone: Intl.DateTimeFormat().resolvedOptions().timeZone,
     }),
   });
   return response.json();
@@ -350,7 +336,7 @@ export default function Log() {
   useEffect(() => {
     if (!email) return;
 
-    fetch(`http://localhost:8000/meals/today?user_email=${encodeURIComponent(email)}`)
+    fetch(`http://localhost:8000/meals/today?user_email=${encodeURIComponent(email)}&tz=${encodeURIComponent(Intl.DateTimeFormat().resolvedOptions().timeZone)}`)
       .then((res) => (res.ok ? res.json() : null))
       .then((data) => {
         if (!data) return;
@@ -537,7 +523,7 @@ function capturePhoto() {
     }
 
     try {
-        await fetch(`http://localhost:8000/meals/${itemToRemove.id}`, {
+        await fetch(`http://localhost:8000/meals/${itemToRemove.id}?tz=${encodeURIComponent(Intl.DateTimeFormat().resolvedOptions().timeZone)}`, {
             method: "DELETE",
         });
         setRefreshKey((k) => k + 1);
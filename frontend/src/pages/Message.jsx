@@ -36,6 +36,8 @@ async function compressImage(dataUrl, quality = 0.6, maxWidth = 800) {
 export default function Message() {
   const email = localStorage.getItem("currentUserEmail") || "guest";
   const storageKey = useMemo(() => `chompsmart_threads_${email}`, [email]);
+  // Chompy's side of the conversation lives on the server, keyed by this id
+  const conversationKey = `chompsmart_conversation_${email}`;
 
   const starterThreads = useMemo(
     () => ({
@@ -211,14 +213,16 @@ export default function Message() {
       
       try {
         const compressedImage = await compressImage(dataUrl);
+        const photo = await (await fetch(compressedImage)).blob();
 
-        const res = await fetch("http://localhost:8000/chat/upload", {
+        const form = new FormData();
+        form.append("photo", photo, "photo.jpg");
+        form.append("user_email", email);
+        form.append("timezone", Intl.DateTimeFormat().resolvedOptions().timeZone);
+
+        const res = await fetch("http://localhost:8000/chat/upload/photo", {
           method: "POST",
-          headers: { "Content-Type": "application/json" },
-          body: JSON.stringify({
-            image: compressedImage,
-            user_email: email,
-          }),
+          body: form,
         });
 
         const data = await res.json();
@@ -297,39 +301,62 @@ export default function Message() {
     if (activeThread === "chompy") {
       setTyping(true);
       try {
-        const history = updatedThreads.chompy.map(m => ({
-            from: m.from, 
-            body: m.body 
-        }));
-
-        const res = await fetch("http://localhost:8000/chat/message", {
+        const res = await fetch("http://localhost:8000/chat/message/stream", {
           method: "POST",
           headers: {
             "Content-Type": "application/json",
           },
           body: JSON.stringify({
             message: trimmed,
-            history: history,
-            user_email: email
+            user_email: email,
+            timezone: Intl.DateTimeFormat().resolvedOptions().timeZone,
+            conversation_id: localStorage.getItem(conversationKey),
           }),
         });
 
-        const data = await res.json();
-        if (data?.reply) {
-          setThreads((prev) => ({
-            ...prev,
-            chompy: [
-              ...(prev.chompy || []),
-              {
-                id: `${Date.now()}_bot`,
-                from: "bot",
-                name: "Chompy",
-                avatar: "gator",
-                time: nowTime(),
-                body: data.reply,
-              },
-            ],
-          }));
+        // the reply arrives as server-sent events: "token" chunks, then "done" with the final text
+        const botId = `${Date.now()}_bot`;
+        const setBotBody = (body) => {
+          setThreads((prev) => {
+            const list = prev.chompy || [];
+            if (list.some((m) => m.id === botId)) {
+              return { ...prev, chompy: list.map((m) => (m.id === botId ? { ...m, body } : m)) };
+            }
+            return {
+              ...prev,
+              chompy: [
+                ...list,
+                { id: botId, from: "bot", name: "Chompy", avatar: "gator", time: nowTime(), body },
+              ],
+            };
+          });
+        };
+
+        const reader = res.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+        let streamed = "";
+        while (true) {
+          const { value, done } = await reader.read();
+          if (done) break;
+          buffer += decoder.decode(value, { stream: true });
+          const events = buffer.split("\n\n");
+          buffer = events.pop();
+          for (const raw of events) {
+            const event = raw.match(/^event: (.*)$/m)?.[1];
+            const dataLine = raw.match(/^data: (.*)$/m)?.[1];
+            if (!dataLine) continue;
+            const data = JSON.parse(dataLine);
+            if (event === "token") {
+              streamed += data.text;
+              setTyping(false);
+              setBotBody(streamed);
+            } else if (data?.reply) {
+              setBotBody(data.reply);
+              if (data.conversation_id) localStorage.setItem(conversationKey, data.conversation_id);
+              if (data.pending_log_id) confirmMealLog(data.pending_log_id, data.reply, setBotBody);
+            }
+          }
         }
       } catch (err) {
         console.error(err);
@@ -339,9 +366,30 @@ export default function Message() {
     }
   }
 
+  // meals Chompy logs are saved in the background; check on it and own up if it failed
+  async function confirmMealLog(pendingId, reply, setBotBody) {
+    for (let attempt = 0; attempt < 10; attempt++) {
+      await new Promise((resolve) => setTimeout(resolve, 300));
+      try {
+        const res = await fetch(`http://localhost:8000/chat/log/${pendingId}`);
+        if (!res.ok) return;
+        const data = await res.json();
+        if (data.status === "logged") return;
+        if (data.status === "failed") {
+          setBotBody(`${reply} (I tried to log that, but hit a glitch!)`);
+          return;
+        }
+      } catch (err) {
+        console.error(err);
+        return;
+      }
+    }
+  }
+
   function clearActiveChat() {
     if (!activeThread) return;
     if (!window.confirm("Clear this chat?")) return;
+    if (activeThread === "chompy") localStorage.removeItem(conversationKey);
     setThreads((prev) => ({
       ...prev,
       [activeThread]: starterThreads[activeThread],